@@ -10,11 +10,11 @@ VEG_SYMBOL = "<img src='https://gimgs2.nohat.cc/thumb/f/640/vegetarian-food-symb
 NON_VEG_SYMBOL = "<img src='https://rukminim3.flixcart.com/image/850/1000/kzfvzww0/noodle/n/1/m/280-buldak-cream-carbonara-hot-chiken-flavor-ramen-140g-1pack-original-imagbg69ynhtw8h2.jpeg' style='width: 15px; height: 15px; margin-right: 5px; vertical-align: middle; display: inline-block;' />"
 
 
-def format_response(database_records, result_count):
+def format_response(database_records, result_count, total_records=None):
     formatted_output = ""
     list_of_output = []
 
-    number_of_results_obtained = len(database_records)
+    number_of_results_obtained = total_records or len(database_records)
     if isinstance(database_records, list):
         if number_of_results_obtained>result_count:
             database_records = database_records[:result_count]
@@ -141,28 +141,29 @@ def format_response(database_records, result_count):
 
     return formatted_output
 
-def get_database_records(query, threshold):
+def get_database_records(query, threshold, result_count):
     try:
         response = json.loads(requests.post(
             url='http://localhost:8080/query',
             json={
                 "query": query,
-                "threshold": threshold
+                "threshold": threshold,
+                "page_size": int(result_count)
             }
         ).text)
         
         database_records = response.get('database_records')
-        return database_records
+        return database_records, response.get('total_records')
     except Exception as e:
         print(f"Request failed: {e}")
-        return "Looks like there's some error while fetching the data for this query, please clear the input and try again with a new query."
+        return "Looks like there's some error while fetching the data for this query, please clear the input and try again with a new query.", None
     
 def chatbot_wrapper(query, threshold, result_count):
     start_time = time.time()
 
-    database_records = get_database_records(query=query, threshold=threshold)
+    database_records, total_records = get_database_records(query=query, threshold=threshold, result_count=result_count)
 
-    response = format_response(database_records, result_count)
+    response = format_response(database_records, result_count, total_records)
 
     elapsed_time = round(time.time() - start_time, 2)
     return response, f"Execution time: {elapsed_time} seconds"
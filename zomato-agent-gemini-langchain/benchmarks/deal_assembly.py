@@ -0,0 +1,84 @@
+"""
+Micro-benchmark for deal assembly (`prepare_db_records`).
+
+Builds synthetic per-dish result lists shaped like the parameter-based
+agent's query results (by default 5 dishes x 10k rows spread over 1k
+restaurants) and times candidate ranking, top-K selection and deal
+assembly for a few limits. No Neo4j or Gemini access is needed.
+
+Run from the `zomato-agent-gemini-langchain` directory:
+
+    python -m benchmarks.deal_assembly --entities 5 --rows 10000 --runs 5
+"""
+import os
+import time
+import random
+import asyncio
+import argparse
+import statistics
+
+# zomato_agent checks for credentials on import; nothing here connects
+for key, value in {
+    "GEMINI_API_KEY": "placeholder",
+    "NEO4J_URI": "neo4j://192.0.2.1:7687",
+    "NEO4J_USERNAME": "placeholder",
+    "NEO4J_PASSWORD": "placeholder",
+}.items():
+    os.environ.setdefault(key, value)
+
+from zomato_agent.parameter_based_agent.prepare_db_records import prepare_db_records
+
+
+def synthetic_results(entities, rows, restaurants, seed=0):
+    rng = random.Random(seed)
+    results = []
+    for entity in range(entities):
+        records = []
+        for row in range(rows):
+            restaurant_id = rng.randrange(restaurants)
+            records.append({
+                "restaurant_id": restaurant_id,
+                "restaurant": f"Restaurant {restaurant_id}",
+                "zomato_page": f"https://www.zomato.com/restaurant-{restaurant_id}",
+                "delivery_rating": f"{rng.uniform(2.5, 5.0):.1f}",
+                "food_name": f"Dish {entity}-{row}",
+                "food_type": rng.choice(["veg", "non-veg"]),
+                "price": rng.randrange(50, 800, 10),
+                "quantity": rng.randint(1, 3),
+                "food_rating": rng.choice([None, f"{rng.uniform(2.5, 5.0):.1f}"]),
+                "similarity_score": round(rng.uniform(0.9, 1.0), 3),
+            })
+        results.append(records)
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--entities", type=int, default=5)
+    parser.add_argument("--rows", type=int, default=10000, help="result rows per entity")
+    parser.add_argument("--restaurants", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--limits", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    results = synthetic_results(args.entities, args.rows, args.restaurants)
+    print(f"{args.entities} entities x {args.rows} rows over {args.restaurants} restaurants")
+
+    filters = {
+        "default": {},
+        "food_price_filter=ASC": {"food_price_filter": "ASC"},
+        "food_rating_filter=DESC": {"food_rating_filter": "DESC"},
+    }
+    for name, params in filters.items():
+        for limit in args.limits:
+            timings = []
+            for _ in range(args.runs):
+                start = time.perf_counter()
+                output = asyncio.run(prepare_db_records(results, params={**params, "limit": limit}))
+                timings.append(time.perf_counter() - start)
+
+            print(f"{name:<24} limit {limit:>5}: {len(output):>5} deals | "
+                  f"min {min(timings) * 1000:.1f}ms | median {statistics.median(timings) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,526 @@
+"""
+Deterministic stand-ins for Gemini and Neo4j, for the offline benchmarks.
+
+Selected with BACKEND_FACTORY=benchmarks.fakes:backends (see
+`zomato_agent.get_backends`):
+
+  llm           a chat model that answers the guardrail, entity extraction
+                and validation chains with rule-based structured output and
+                the text2cypher/correction chains with a fixed statement
+  embeddings    hashed character-trigram vectors
+  run_query     a synthetic restaurant/food graph that answers the statements
+                the package sends (hybrid search, the parameter-based
+                templates, batched orders, value mapping, EXPLAIN) from their
+                parameters instead of parsing Cypher
+  graph_schema  the schema of that graph
+
+Each stand-in can add a fixed latency per call (FAKE_LLM_LATENCY_MS,
+FAKE_EMBEDDING_LATENCY_MS, FAKE_DB_LATENCY_MS) to approximate the network.
+The dataset is seeded (FAKE_GRAPH_SEED, FAKE_GRAPH_RESTAURANTS,
+FAKE_GRAPH_FOODS_PER_RESTAURANT), so runs are repeatable.
+"""
+import os
+import re
+import time
+import random
+import asyncio
+import hashlib
+import numpy as np
+from typing import Any, List, Optional
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+
+RESTAURANT_NAMES = [
+    "KFC", "McDonald's", "Domino's Pizza", "Burger King", "Haldiram's", "Sagar Ratna", "Bikanervala",
+    "Cafe Coffee Day", "Wow! Momo", "Punjabi By Nature", "Pizza Hut", "Chaayos", "Keventers",
+    "Moti Mahal Delux", "Saravana Bhavan", "Taco Bell", "Sushi Junction", "Theobroma", "Behrouz Biryani",
+    "Nazeer Foods",
+]
+
+CUISINES = [
+    "north indian", "south indian", "chinese", "italian", "fast food", "desserts", "beverages", "cafe",
+    "mexican", "japanese", "mughlai", "street food",
+]
+
+AREAS = ["connaught place", "hauz khas", "saket", "rajouri garden", "karol bagh", "lajpat nagar", "vasant kunj", "dwarka"]
+
+# (name, type, base price)
+DISHES = [
+    ("kadai paneer", "veg", 280), ("mix veg", "veg", 220), ("roti", "veg", 25), ("tandoori roti", "veg", 30),
+    ("garlic naan", "veg", 60), ("butter naan", "veg", 55), ("butter chicken", "non-veg", 360),
+    ("masala dosa", "veg", 140), ("plain dosa", "veg", 110), ("lassi", "veg", 80), ("mango lassi", "veg", 110),
+    ("sweet lassi", "veg", 90), ("dal fry", "veg", 180), ("dal makhani", "veg", 240), ("veg thali", "veg", 260),
+    ("non-veg thali", "non-veg", 340), ("momos", "veg", 120), ("chicken momos", "non-veg", 150),
+    ("veg burrito", "veg", 190), ("chicken burrito", "non-veg", 230), ("salmon sushi", "non-veg", 520),
+    ("veg sushi", "veg", 380), ("dark chocolate cake", "veg", 450), ("milk cake", "veg", 160),
+    ("mocha", "veg", 170), ("cafe latte", "veg", 150), ("mc aloo tikki burger", "veg", 60),
+    ("chicken burger", "non-veg", 150), ("veg burger", "veg", 110), ("margherita pizza", "veg", 250),
+    ("pepperoni pizza", "non-veg", 420), ("veg biryani", "veg", 220), ("chicken biryani", "non-veg", 300),
+    ("paneer tikka", "veg", 260), ("chicken tikka", "non-veg", 320), ("egg curry", "egg", 180),
+    ("masala omelette", "egg", 90), ("hot and sour soup", "veg", 130), ("hakka noodles", "veg", 160),
+    ("chilli chicken", "non-veg", 280), ("idli sambar", "veg", 90), ("vada", "veg", 70),
+    ("chole bhature", "veg", 150), ("gulab jamun", "veg", 80), ("rasmalai", "veg", 120),
+    ("french fries", "veg", 99), ("cold coffee", "veg", 140), ("masala chai", "veg", 40),
+]
+
+KNOWN_RESTAURANTS = ["kfc", "mcdonald", "domino", "burger king", "haldiram", "pizza hut", "zomato"]
+
+GENERAL_CYPHER = (
+    "MATCH (r:Restaurant)-[:DELIVERS]->(f:Food) "
+    "RETURN r.id AS restaurant_id, r.name AS restaurant, f.name AS food_name, f.price AS price "
+    "ORDER BY f.price DESC LIMIT 10"
+)
+
+def _latency(name):
+    return float(os.getenv(name, "0")) / 1000
+
+
+def trigram_vector(text, dimension=256):
+    """
+    Unit vector of the hashed character trigrams of `text`'s words.
+    """
+    vector = np.zeros(dimension, dtype=np.float32)
+    for word in re.findall(r"[a-z0-9]+", text.lower()):
+        padded = f" {word} "
+        for i in range(len(padded) - 2):
+            digest = hashlib.md5(padded[i:i + 3].encode()).digest()
+            vector[int.from_bytes(digest[:4], "little") % dimension] += 1.0
+
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, dimension=256, latency=0.0):
+        self.dimension = dimension
+        self.latency = latency
+
+    def embed_documents(self, texts):
+        time.sleep(self.latency)
+        return [trigram_vector(text, self.dimension).tolist() for text in texts]
+
+    def embed_query(self, text):
+        time.sleep(self.latency)
+        return trigram_vector(text, self.dimension).tolist()
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self.latency)
+        return [trigram_vector(text, self.dimension).tolist() for text in texts]
+
+    async def aembed_query(self, text):
+        await asyncio.sleep(self.latency)
+        return trigram_vector(text, self.dimension).tolist()
+
+
+def fake_entities(question):
+    """
+    Rule-based stand-in for the entity extraction chain: one entity per known
+    dish in the question, or a single restaurant-level entity.
+    """
+    text = question.lower()
+
+    dishes, taken = [], []
+    for name, _, _ in sorted(DISHES, key=lambda dish: -len(dish[0])):
+        for match in re.finditer(rf"\b{re.escape(name)}\b", text):
+            if not any(start < match.end() and match.start() < end for start, end in taken):
+              taken.append((match.start(), match.end()))
+              quantity = re.search(r"(\d+)\s*-\s*$", text[:match.start()])
+              dishes.append((match.start(), name, int(quantity.group(1)) if quantity else 1))
+    dishes.sort()
+
+    limit = re.search(r"top (\d+)", text)
+    price = re.search(r"under (\d+)", text)
+    rating = re.search(r"rating (?:atleast|at least|above|of) (\d+(?:\.\d+)?)", text)
+    address = re.search(r"near ([a-z ]+?)(?: which|\.|,|$)", text)
+    deliverables = re.search(r"serves? ([a-z ]+?) food", text) or re.search(
+        r"\b(italian|chinese|turkish|mexican|japanese|south indian|north indian|cafe)\b", text
+    )
+
+    order_filter = {}
+    if "expensive" in text:
+      order_filter["food_price_filter"] = "DESC"
+    elif "cheap" in text:
+      order_filter["food_price_filter"] = "ASC"
+    if "highest rated" in text or "top rated" in text:
+      order_filter["food_rating_filter" if dishes else "restaurant_rating_filter"] = "DESC"
+
+    restaurant_name_pair = [
+        {"restaurant_name": name, "condition": not re.search(rf"not (?:from|at) {name}", text)}
+        for name in KNOWN_RESTAURANTS if name in text
+    ]
+
+    entity = {
+        "food_name": "",
+        "flavour": "",
+        "bestseller": "true" if "bestsell" in text else "false",
+        "type_": "non-veg" if "non-veg" in text else "veg" if re.search(r"\bveg\b", text) else "not_mentioned",
+        "food_rating": "not_available",
+        "food_price": float(price.group(1)) if price else 0.0,
+        "quantity": 1,
+        "restaurant_name_pair": restaurant_name_pair,
+        "restaurant_deliverables": deliverables.group(1) if deliverables and not dishes else "",
+        "restaurant_rating": float(rating.group(1)) if rating else "not_available",
+        "restaurant_phone_number": "",
+        "restaurant_address": address.group(1) if address else "",
+        "limit": int(limit.group(1)) if limit else 0,
+        "order_filter": order_filter or None,
+    }
+
+    if not dishes:
+      return {"order_info": [entity]}
+    return {"order_info": [{**entity, "food_name": name, "quantity": quantity} for _, name, quantity in dishes]}
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Answers structured-output chains by schema name and every other chain with
+    GENERAL_CYPHER, after `latency` seconds. Token usage is reported as
+    characters / 4 so the tracing counters have something to count.
+    """
+
+    latency: float = 0.0
+
+    @property
+    def _llm_type(self):
+        return "fake-gemini"
+
+    def bind_tools(self, tools, **kwargs):
+        return self.bind(tools=tools, **kwargs)
+
+    def _respond(self, messages, tools):
+        prompt = "\n".join(str(message.content) for message in messages)
+        usage = {"input_tokens": len(prompt) // 4}
+
+        if not tools:
+          usage["output_tokens"] = len(GENERAL_CYPHER) // 4
+          usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+          return AIMessage(content=GENERAL_CYPHER, usage_metadata=usage)
+
+        name = getattr(tools[0], "__name__", None) or tools[0]["function"]["name"]
+        if name == "Entities":
+          question = re.search(r'"input: (.*)",', prompt)
+          args = fake_entities(question.group(1) if question else str(messages[-1].content))
+        elif name == "GuardrailsOutput":
+          args = {"decision": "food"}
+        elif name == "ValidateCypherOutput":
+          args = {"errors": [], "filters": []}
+        else:
+          args = {}
+
+        usage["output_tokens"] = len(str(args)) // 4
+        usage["total_tokens"] = usage["input_tokens"] + usage["output_tokens"]
+        return AIMessage(content="", tool_calls=[{"name": name, "args": args, "id": "call_0"}], usage_metadata=usage)
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, kwargs.get("tools")))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._respond(messages, kwargs.get("tools")))])
+
+
+def _rating(value):
+    try:
+      return float(value)
+    except (TypeError, ValueError):
+      return None
+
+
+class SyntheticGraph:
+    """
+    Seeded restaurants and foods, and `run_query`, which answers the package's
+    statements from their parameters.
+    """
+
+    def __init__(self, restaurants=200, foods_per_restaurant=40, seed=0, latency=0.0, embeddings=None):
+        rng = random.Random(seed)
+        self.latency = latency
+        self.restaurants = []
+        self.foods = []
+
+        for index in range(restaurants):
+            area = rng.choice(AREAS)
+            name = RESTAURANT_NAMES[index % len(RESTAURANT_NAMES)]
+            self.restaurants.append({
+                "id": f"r{index}",
+                "name": f"{name} - {area.title()}" if index >= len(RESTAURANT_NAMES) else name,
+                "url": f"https://www.zomato.com/ncr/restaurant-{index}",
+                "image_url": f"https://images.example/restaurants/{index}.jpg",
+                "delivery_rating": rng.choice(["not_available", f"{rng.uniform(2.5, 4.9):.1f}"]),
+                "dining_rating": rng.choice(["not_available", f"{rng.uniform(2.5, 4.9):.1f}"]),
+                "deliverables": ", ".join(rng.sample(CUISINES, 3)),
+                "phone_no": f"11{rng.randrange(10 ** 8):08d}",
+                "address": f"{rng.randrange(1, 200)}, {area}, new delhi",
+            })
+
+            for dish_index, (dish, food_type, base_price) in enumerate(rng.sample(DISHES, min(foods_per_restaurant, len(DISHES)))):
+                self.foods.append({
+                    "id": f"r{index}-f{dish_index}",
+                    "restaurant": index,
+                    "name": dish.title(),
+                    "type": food_type,
+                    "price": float(round(base_price * rng.uniform(0.8, 1.5))),
+                    "bestseller": rng.random() < 0.2,
+                    "rating": rng.choice(["not_available", f"{rng.uniform(2.5, 5.0):.1f}"]),
+                    "desc": f"{dish} made fresh",
+                    "image_url": f"https://images.example/foods/{index}-{dish_index}.jpg",
+                })
+
+        self.food_index = {food["id"]: food for food in self.foods}
+        embeddings = embeddings or FakeEmbeddings()
+        self.food_matrix = np.asarray(
+            [trigram_vector(f"{food['name']} {food['type']}", embeddings.dimension) for food in self.foods]
+        )
+
+        # Word -> food positions, standing in for the fulltext index
+        self.food_words = {}
+        for position, food in enumerate(self.foods):
+            for word in set(re.findall(r"[a-z0-9]+", food["name"].lower())):
+                self.food_words.setdefault(word, []).append(position)
+
+    def schema(self):
+        node_props = {
+            "Restaurant": [
+                {"property": prop, "type": "STRING"}
+                for prop in ["id", "name", "url", "image_url", "delivery_rating", "dining_rating", "deliverables", "phone_no", "address"]
+            ],
+            "Food": [
+                {"property": "id", "type": "STRING"}, {"property": "name", "type": "STRING"},
+                {"property": "price", "type": "FLOAT"}, {"property": "bestseller", "type": "BOOLEAN"},
+                {"property": "type", "type": "STRING"}, {"property": "rating", "type": "STRING"},
+                {"property": "desc", "type": "STRING"}, {"property": "image_url", "type": "STRING"},
+                {"property": "embedding", "type": "LIST"},
+            ],
+            "Category": [{"property": "name", "type": "STRING"}],
+        }
+        relationships = [
+            {"start": "Restaurant", "type": "DELIVERS", "end": "Food"},
+            {"start": "Food", "type": "COMES_UNDER", "end": "Category"},
+        ]
+        structured_schema = {"node_props": node_props, "rel_props": {}, "relationships": relationships, "metadata": {}}
+
+        schema = "Node properties:\n" + "\n".join(
+            label + " {" + ", ".join(f"{prop['property']}: {prop['type']}" for prop in props) + "}"
+            for label, props in node_props.items()
+        ) + "\nRelationship properties:\n\nThe relationships:\n" + "\n".join(
+            f"(:{rel['start']})-[:{rel['type']}]->(:{rel['end']})" for rel in relationships
+        )
+        return schema, structured_schema
+
+    def schema_tokens(self):
+        """
+        The label, relationship type and property key tokens, as the Cypher
+        cache's schema probe reads them.
+        """
+        _, structured_schema = self.schema()
+        return {
+            "labels": sorted(structured_schema["node_props"]),
+            "types": sorted({rel["type"] for rel in structured_schema["relationships"]}),
+            "properties": sorted({prop["property"] for props in structured_schema["node_props"].values() for prop in props}),
+        }
+
+    def food_scores(self, params):
+        similarities = self.food_matrix @ np.asarray(params["embedding"], dtype=np.float32)
+        words = set(re.findall(r"[a-z0-9]+", params.get("query_text", "").lower()))
+        if words:
+          overlap = np.zeros(len(self.foods), dtype=np.float32)
+          for word in words:
+              overlap[self.food_words.get(word, [])] += 1
+          similarities = np.maximum(similarities / max(similarities.max(), 1e-9), overlap / max(overlap.max(), 1e-9))
+        else:
+          similarities = similarities / max(similarities.max(), 1e-9)
+
+        order = np.argsort(-similarities, kind="stable")[:params["k"]]
+        return [
+            {"id": self.foods[i]["id"], "score": float(similarities[i])}
+            for i in order if similarities[i] >= params["passing_threshold"]
+        ]
+
+    def _restaurant_matches(self, restaurant, params):
+        name = restaurant["name"].lower()
+        if params.get("delivery_rating") is not None:
+          if (_rating(restaurant["delivery_rating"]) or -1) < float(params["delivery_rating"]):
+            return False
+        if params.get("phone_number") and params["phone_number"] not in restaurant["phone_no"]:
+          return False
+        if params.get("address") and params["address"] not in restaurant["address"]:
+          return False
+        if params.get("name_seek") and params["name_seek"] not in name:
+          return False
+        for pair_name, condition in params.get("name") or []:
+            if (pair_name.lower() in name) != condition:
+              return False
+        return True
+
+    def _food_matches(self, food, params):
+        if params.get("bestseller") and not food["bestseller"]:
+          return False
+        if params.get("type") and food["type"] != params["type"]:
+          return False
+        if params.get("food_rating") is not None and (_rating(food["rating"]) or -1) < float(params["food_rating"]):
+          return False
+        if params.get("price") is not None and food["price"] > params["price"] + (params.get("tolerance") or 0):
+          return False
+        return True
+
+    def entity_rows(self, params):
+        """
+        The rows of one parameter-based statement (the build_cypher_query
+        template for these parameters).
+        """
+        params = {key: value for key, value in params.items() if value is not None}
+
+        restaurant_scores = None
+        if "deliverables" in params:
+          words = set(params["deliverables"].split())
+          restaurant_scores = {
+              index: len(words & set(restaurant["deliverables"].replace(",", " ").split())) / len(words)
+              for index, restaurant in enumerate(self.restaurants)
+          }
+          restaurant_scores = {index: score for index, score in restaurant_scores.items() if score > 0}
+
+        def restaurant_ok(index):
+            return (restaurant_scores is None or index in restaurant_scores) and self._restaurant_matches(self.restaurants[index], params)
+
+        rows = []
+        if "food_scores" in params or "quantity" in params:
+          if "food_scores" in params:
+            candidates = [(self.food_index[score["id"]], score["score"]) for score in params["food_scores"] if score["id"] in self.food_index]
+          else:
+            candidates = [(food, None) for food in self.foods]
+
+          for food, similarity in candidates:
+              if not restaurant_ok(food["restaurant"]) or not self._food_matches(food, params):
+                continue
+              restaurant = self.restaurants[food["restaurant"]]
+              row = {
+                  "restaurant_id": restaurant["id"],
+                  "restaurant": restaurant["name"],
+                  "zomato_page": restaurant["url"],
+                  "delivery_rating": restaurant["delivery_rating"],
+                  "food_name": food["name"],
+                  "bestseller": food["bestseller"],
+                  "price": food["price"],
+                  "food_type": food["type"],
+                  "quantity": params.get("quantity", 1),
+                  "food_rating": None if food["rating"] == "not_available" else food["rating"],
+                  "description": food["desc"],
+                  "food_image_url": food["image_url"],
+              }
+              if similarity is not None:
+                row["similarity_score"] = similarity
+              if restaurant_scores is not None:
+                row["restaurant_score"] = restaurant_scores[food["restaurant"]]
+              rows.append(row)
+        else:
+          for index, restaurant in enumerate(self.restaurants):
+              if not restaurant_ok(index):
+                continue
+              row = {
+                  "restaurant_id": restaurant["id"],
+                  "restaurant": restaurant["name"],
+                  "zomato_page": restaurant["url"],
+                  "restaurant_image_url": restaurant["image_url"],
+                  "delivery_rating": _rating(restaurant["delivery_rating"]) and restaurant["delivery_rating"],
+                  "dining_rating": _rating(restaurant["dining_rating"]) and restaurant["dining_rating"],
+                  "deliverables": restaurant["deliverables"],
+                  "phone_number": restaurant["phone_no"],
+                  "address": restaurant["address"],
+              }
+              if restaurant_scores is not None:
+                row["restaurant_score"] = restaurant_scores[index]
+              rows.append(row)
+
+        if "top_k" in params:
+          rows = self.top_k_rows(rows, params)
+        return rows
+
+    def top_k_rows(self, rows, params):
+        """
+        The cut of generate_parameter_based_cypher.top_k_statement: the distinct
+        rows ranked like deal_combinations, keeping the ties of the last one.
+        """
+        from zomato_agent.parameter_based_agent.deal_combinations import CandidateTable
+
+        table = CandidateTable(rows, 0, params, {})
+        ranked = sorted(
+            zip(np.round(-table.ranking_similarity, 9).tolist(), table.tiebreak.tolist(), table.records),
+            key=lambda ranking: ranking[:2],
+        )
+        top_k = int(params["top_k"])
+        if len(ranked) > top_k:
+          last = ranked[top_k - 1][:2]
+          ranked = [ranking for ranking in ranked if ranking[:2] <= last]
+        return [record for _, _, record in ranked]
+
+    def batched_rows(self, params):
+        entity_params = {}
+        for key, value in params.items():
+            index, _, name = key[1:].partition("_")
+            entity_params.setdefault(int(index), {})[name] = value
+
+        grouped = {}
+        for index, entity in sorted(entity_params.items()):
+            for row in self.entity_rows(entity):
+                entities = grouped.setdefault(row["restaurant_id"], {})
+                entities.setdefault(index, []).append(row)
+
+        return [
+            {"restaurant_id": restaurant_id, "entities": [{"entity_index": index, "records": records} for index, records in entities.items()]}
+            for restaurant_id, entities in grouped.items()
+        ]
+
+    def general_rows(self):
+        foods = sorted(self.foods, key=lambda food: -food["price"])[:10]
+        return [
+            {
+                "restaurant_id": self.restaurants[food["restaurant"]]["id"],
+                "restaurant": self.restaurants[food["restaurant"]]["name"],
+                "food_name": food["name"],
+                "price": food["price"],
+            }
+            for food in foods
+        ]
+
+    def answer(self, query, params):
+        if query.lstrip().upper().startswith("EXPLAIN"):
+          return []
+        if "db.labels()" in query:
+          return [self.schema_tokens()]
+        if "db.index.vector.queryNodes" in query and "$embedding" in query:
+          return self.food_scores(params)
+        if "UNWIND $filters" in query:
+          return [{"index": filter["index"], "hit": True} for filter in params["filters"]]
+        if "AS entity_index" in query:
+          return self.batched_rows(params)
+        if "count(" in query and "restaurants" in query:
+          return [{"restaurants": len(self.restaurants), "foods": len(self.foods)}]
+        if "$" in query:
+          return self.entity_rows(params)
+        return self.general_rows()
+
+    async def run_query(self, query, params):
+        await asyncio.sleep(self.latency)
+        return self.answer(query, params)
+
+
+def backends():
+    embeddings = FakeEmbeddings(latency=_latency("FAKE_EMBEDDING_LATENCY_MS"))
+    graph = SyntheticGraph(
+        restaurants=int(os.getenv("FAKE_GRAPH_RESTAURANTS", "200")),
+        foods_per_restaurant=int(os.getenv("FAKE_GRAPH_FOODS_PER_RESTAURANT", "40")),
+        seed=int(os.getenv("FAKE_GRAPH_SEED", "0")),
+        latency=_latency("FAKE_DB_LATENCY_MS"),
+        embeddings=embeddings,
+    )
+
+    return {
+        "llm": FakeChatModel(latency=_latency("FAKE_LLM_LATENCY_MS")),
+        "embeddings": embeddings,
+        "run_query": graph.run_query,
+        "graph_schema": graph.schema(),
+    }
@@ -0,0 +1,149 @@
+"""
+End-to-end benchmark of the LangGraph pipeline with no Gemini or Neo4j.
+
+Swaps in the deterministic stand-ins from `benchmarks.fakes` (a rule-based
+chat model, hashed embeddings and a seeded synthetic restaurant/food graph),
+runs the gradio example questions through `langgraph` at each concurrency
+level and reports p50/p95/p99 latency per node and overall, plus throughput.
+Per-node times come from the tracing spans, so they include everything the
+node awaits (governor queueing, coalescing, the stand-ins' latency).
+
+The cypher and query-embedding caches are off by default so every run does
+the full work; pass --caches to measure with them. The LLM/embedding rate
+buckets are off too, leaving only the governors' concurrency limits.
+
+Run from the `zomato-agent-gemini-langchain` directory:
+
+    python -m benchmarks.pipeline --requests 200 --concurrency 1 8 32 --llm-latency 300 --db-latency 20
+"""
+import os
+import ast
+import time
+import asyncio
+import argparse
+import tempfile
+import numpy as np
+
+
+CURRENT_DIR = os.path.dirname(os.path.abspath(__file__))
+GRADIO_APP = os.path.join(CURRENT_DIR, "..", "..", "gradio_app.py")
+
+
+def gradio_examples(path=GRADIO_APP):
+    """
+    The questions of the `examples=[...]` list in gradio_app.py, read without
+    importing gradio.
+    """
+    with open(path, encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.keyword) and node.arg == "examples":
+          return [example[0] for example in ast.literal_eval(node.value)]
+    raise ValueError(f"No examples=[...] in {path}")
+
+def configure(args):
+    """
+    Environment for the stand-ins; must run before zomato_agent is imported.
+    """
+    scratch = tempfile.mkdtemp(prefix="zomato-benchmark-")
+    settings = {
+        # zomato_agent checks for credentials on import; nothing here connects
+        "GEMINI_API_KEY": "placeholder",
+        "NEO4J_URI": "neo4j://192.0.2.1:7687",
+        "NEO4J_USERNAME": "placeholder",
+        "NEO4J_PASSWORD": "placeholder",
+        "BACKEND_FACTORY": "benchmarks.fakes:backends",
+        "SNAPSHOT_DIR": os.path.join(scratch, "snapshot"),
+        "EMBEDDING_CACHE_DIR": os.path.join(scratch, "embeddings"),
+        "MIGRATED_PROPERTIES": "false",
+        "LLM_RPM": "0",
+        "LLM_TPM": "0",
+        "EMBEDDING_RPM": "0",
+        "EMBEDDING_TPM": "0",
+        "FAKE_LLM_LATENCY_MS": str(args.llm_latency),
+        "FAKE_EMBEDDING_LATENCY_MS": str(args.embedding_latency),
+        "FAKE_DB_LATENCY_MS": str(args.db_latency),
+        "FAKE_GRAPH_RESTAURANTS": str(args.restaurants),
+        "FAKE_GRAPH_FOODS_PER_RESTAURANT": str(args.foods_per_restaurant),
+        "FAKE_GRAPH_SEED": str(args.seed),
+    }
+    if not args.caches:
+      settings.update({"CYPHER_CACHE_SIZE": "0", "QUERY_EMBEDDING_CACHE_SIZE": "0"})
+
+    for key, value in settings.items():
+        os.environ.setdefault(key, value)
+
+async def run_one(langgraph, question, threshold):
+    from zomato_agent.tracing import start_trace, end_trace
+
+    trace, token = start_trace()
+    try:
+      result = await langgraph.ainvoke({"question": question, "passing_threshold": threshold})
+    finally:
+      end_trace(trace, token)
+
+    nodes = {}
+    for span in trace.spans[1:]:
+        nodes[span.node] = nodes.get(span.node, 0.0) + span.seconds
+    return trace.request_span.seconds, nodes, result
+
+async def run_level(langgraph, questions, requests, concurrency, threshold):
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def bounded(i):
+        async with semaphore:
+          return await run_one(langgraph, questions[i % len(questions)], threshold)
+
+    start = time.perf_counter()
+    runs = await asyncio.gather(*(bounded(i) for i in range(requests)))
+    return time.perf_counter() - start, runs
+
+def report(concurrency, wall_seconds, runs):
+    print(f"\nconcurrency {concurrency}: {len(runs)} requests in {wall_seconds:.2f}s, {len(runs) / wall_seconds:.1f} req/s")
+    print(f"{'node':<28}{'calls':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+    per_node = {}
+    for _, nodes, _ in runs:
+        for node, seconds in nodes.items():
+            per_node.setdefault(node, []).append(seconds)
+    rows = list(per_node.items()) + [("overall", [seconds for seconds, _, _ in runs])]
+
+    for node, timings in rows:
+        p50, p95, p99 = np.percentile(np.asarray(timings) * 1000, [50, 95, 99])
+        print(f"{node:<28}{len(timings):>7}{p50:>10.1f}{p95:>10.1f}{p99:>10.1f}")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=100, help="requests per concurrency level, cycling through the examples")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--threshold", type=float, default=0.6, help="passing_threshold sent with every question")
+    parser.add_argument("--llm-latency", type=float, default=0, help="ms added to every chat model call")
+    parser.add_argument("--embedding-latency", type=float, default=0, help="ms added to every embedding call")
+    parser.add_argument("--db-latency", type=float, default=0, help="ms added to every graph query")
+    parser.add_argument("--restaurants", type=int, default=200)
+    parser.add_argument("--foods-per-restaurant", type=int, default=40)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--caches", action="store_true", help="keep the cypher and query-embedding caches on")
+    args = parser.parse_args()
+
+    configure(args)
+    from zomato_agent.langgraph_agent import langgraph
+
+    questions = gradio_examples()
+    print(f"{len(questions)} example questions, {args.restaurants} restaurants x {args.foods_per_restaurant} foods")
+
+    async def run():
+        # Warm-up: builds the schema, example selector and plan caches once
+        for question in questions:
+            await run_one(langgraph, question, args.threshold)
+
+        for concurrency in args.concurrency:
+            wall_seconds, runs = await run_level(langgraph, questions, args.requests, concurrency, args.threshold)
+            report(concurrency, wall_seconds, runs)
+
+    asyncio.run(run())
+
+
+if __name__ == "__main__":
+    main()
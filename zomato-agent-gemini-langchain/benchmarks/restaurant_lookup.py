@@ -0,0 +1,87 @@
+"""
+Before/after benchmark for case-insensitive restaurant name and address matching.
+
+Runs each lookup on the Restaurant label twice: lowercasing every node at
+query time (`toLower(r.name) CONTAINS $value`, the original predicate) and
+on the pre-lowercased, text-indexed properties added by
+`python -m zomato_agent.graph_migrations` (`r.name_lower CONTAINS $value`).
+Reports the median latency, database hits from PROFILE, and whether the
+plan used an index.
+
+Needs the Neo4j credentials from the environment/.env. Run from the
+`zomato-agent-gemini-langchain` directory:
+
+    python -m benchmarks.restaurant_lookup --runs 20 --name kfc --name domino --address "connaught place"
+"""
+import time
+import asyncio
+import argparse
+import statistics
+from zomato_agent import get_async_driver, close_driver, NEO4J_DATABASE
+
+
+LOOKUPS = {
+    "name": (
+        "MATCH (r:Restaurant) WHERE toLower(r.name) CONTAINS $value RETURN r.id",
+        "MATCH (r:Restaurant) WHERE r.name_lower CONTAINS $value RETURN r.id",
+    ),
+    "address": (
+        "MATCH (r:Restaurant) WHERE toLower(r.address) CONTAINS $value RETURN r.id",
+        "MATCH (r:Restaurant) WHERE r.address_lower CONTAINS $value RETURN r.id",
+    ),
+}
+
+def plan_stats(plan):
+    """
+    Total db hits and operator names of a PROFILE plan tree.
+    """
+    db_hits = plan.get("dbHits", 0)
+    operators = [plan.get("operatorType", "")]
+    for child in plan.get("children", []):
+        child_hits, child_operators = plan_stats(child)
+        db_hits += child_hits
+        operators += child_operators
+    return db_hits, operators
+
+async def measure(session, query, value, runs):
+    result = await session.run("PROFILE " + query, {"value": value})
+    rows = len(await result.data())
+    summary = await result.consume()
+    db_hits, operators = plan_stats(summary.profile)
+
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        result = await session.run(query, {"value": value})
+        await result.consume()
+        timings.append(time.perf_counter() - start)
+
+    index_used = any("Index" in operator for operator in operators)
+    return rows, statistics.median(timings), db_hits, index_used
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--name", action="append", help="lowercase name fragment to look up (repeatable)")
+    parser.add_argument("--address", action="append", help="lowercase address fragment to look up (repeatable)")
+    args = parser.parse_args()
+
+    values = {
+        "name": [value.lower() for value in args.name or ["kfc", "domino"]],
+        "address": [value.lower() for value in args.address or ["connaught place"]],
+    }
+
+    try:
+      async with get_async_driver().session(database=NEO4J_DATABASE) as session:
+        for lookup, (before, after) in LOOKUPS.items():
+            for value in values[lookup]:
+                for label, query in [("toLower()", before), ("lowercased", after)]:
+                    rows, median, db_hits, index_used = await measure(session, query, value, args.runs)
+                    print(f"{lookup:<8} {value!r:<20} {label:<11} rows {rows:>4} | median {median * 1000:7.2f}ms | "
+                          f"db hits {db_hits:>7} | index {'yes' if index_used else 'no'}")
+    finally:
+      await close_driver()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
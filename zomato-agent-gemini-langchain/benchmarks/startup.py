@@ -0,0 +1,92 @@
+"""
+Startup-time benchmark for the zomato_agent package.
+
+Imports `zomato_agent.app` (what a uvicorn worker does before it can serve)
+in fresh interpreters and reports the wall time and every network connection
+attempted during the import. By default it runs with placeholder credentials
+pointing at an unroutable host, so any network access at import time shows up
+as a connection attempt instead of silently succeeding.
+
+Run from the `zomato-agent-gemini-langchain` directory:
+
+    python -m benchmarks.startup --runs 10 --budget 1.0
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+
+PROBE = '''
+import sys, time, json
+
+network_calls = []
+
+def audit(event, args):
+    if event in ("socket.connect", "socket.getaddrinfo"):
+        network_calls.append(f"{event} {args[1] if event == 'socket.connect' else args[0]}")
+
+sys.addaudithook(audit)
+
+start = time.perf_counter()
+import zomato_agent.app
+elapsed = time.perf_counter() - start
+
+print(json.dumps({"seconds": elapsed, "network_calls": network_calls}))
+'''
+
+PLACEHOLDER_ENV = {
+    "GEMINI_API_KEY": "placeholder",
+    "NEO4J_URI": "neo4j://192.0.2.1:7687", # TEST-NET-1, never routable
+    "NEO4J_USERNAME": "placeholder",
+    "NEO4J_PASSWORD": "placeholder",
+}
+
+def run_probe(env):
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE],
+        env=env,
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    )
+    return json.loads(output.stdout.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=1.0, help="fail when the median import time exceeds this many seconds")
+    parser.add_argument("--live", action="store_true", help="use the credentials from the environment/.env instead of placeholders")
+    args = parser.parse_args()
+
+    env = dict(os.environ)
+    if not args.live:
+      env.update(PLACEHOLDER_ENV)
+
+    timings = []
+    network_calls = set()
+    for _ in range(args.runs):
+        result = run_probe(env)
+        timings.append(result["seconds"])
+        network_calls.update(result["network_calls"])
+
+    median = statistics.median(timings)
+    print(f"import zomato_agent.app over {args.runs} runs: "
+          f"min {min(timings):.3f}s | median {median:.3f}s | max {max(timings):.3f}s")
+
+    if network_calls:
+      print("Network calls during import:")
+      for call in sorted(network_calls):
+          print(f"  {call}")
+    else:
+      print("Network calls during import: none")
+
+    if network_calls or median > args.budget:
+      sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,16 @@
 import os
+import threading
 from dotenv import load_dotenv
-from langchain_neo4j import Neo4jGraph
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
 
 from operator import add
-from typing import Annotated, List
+from typing import Annotated, Any, List
 from typing_extensions import TypedDict
-from functools import lru_cache
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
+from functools import lru_cache, wraps
+from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+from .snapshot import snapshot_entry
+from .singleflight import query_coalesced
+from .cassette import cassette
+from .tracing import record_query
 
 
 CURRENT_DIR = os.path.dirname(__file__)
@@ -21,52 +23,279 @@ assert os.getenv("NEO4J_URI"), "NEO4J_URI not set in environment"
 assert os.getenv("NEO4J_USERNAME"), "NEO4J_USERNAME not set in environment"
 assert os.getenv("NEO4J_PASSWORD"), "NEO4J_PASSWORD not set in environment"
 
-enhanced_graph = Neo4jGraph(
-  driver_config={
-        'connection_acquisition_timeout': 30,
-        'max_connection_pool_size': 50,
-        'keep_alive': True,
-        'max_connection_lifetime': 1800, 
-        'connection_timeout': 10,
-  },
+NEO4J_DRIVER_CONFIG = {
+    'connection_acquisition_timeout': 30,
+    'max_connection_pool_size': 50,
+    'keep_alive': True,
+    'max_connection_lifetime': 1800,
+    'connection_timeout': 10,
+}
+
+NEO4J_DATABASE = os.getenv("NEO4J_DATABASE", "neo4j")
+
+def lazy_resource(factory):
+    """
+    Builds a resource on first use instead of at import time, so importing the
+    package never touches the network. The lock keeps a background warm-up and
+    a concurrent request from building the same resource twice.
+    """
+    lock = threading.Lock()
+    cached_factory = lru_cache(maxsize=None)(factory)
+
+    @wraps(factory)
+    def get_resource():
+        with lock:
+            return cached_factory()
+
+    get_resource.cache_clear = cached_factory.cache_clear
+    get_resource.cache_info = cached_factory.cache_info
+    return get_resource
+
+# "module:function" returning stand-ins for the external services, any of
+# {"llm", "embeddings", "run_query", "graph_schema"}; used by the offline
+# benchmarks (benchmarks/fakes.py), never set in production
+BACKEND_FACTORY = os.getenv("BACKEND_FACTORY")
+
+@lazy_resource
+def get_backends():
+    if not BACKEND_FACTORY:
+      return {}
+
+    import importlib
+
+    module_name, _, factory_name = BACKEND_FACTORY.partition(":")
+    return getattr(importlib.import_module(module_name), factory_name)()
+
+@lazy_resource
+def get_enhanced_graph():
+    from langchain_neo4j import Neo4jGraph # deferred, importing langchain_neo4j is slow
+
+    return Neo4jGraph(
+      driver_config=NEO4J_DRIVER_CONFIG,
+    )
+
+# The schema read from Neo4j once the live schema was seen to change: from then
+# on it is used instead of the (now stale) snapshot
+_graph_schema_state = {"reloaded": None}
+
+def _read_graph_schema(refresh=False):
+    def read():
+        built = get_enhanced_graph.cache_info().currsize
+        enhanced_graph = get_enhanced_graph()
+        # A graph built just now has read the schema already
+        if refresh and built:
+          enhanced_graph.refresh_schema()
+        return enhanced_graph.schema, enhanced_graph.structured_schema
+
+    return tuple(cassette.run_sync("graph_schema", [], read))
+
+@lazy_resource
+def _load_graph_schema():
+    if "graph_schema" in get_backends():
+      return get_backends()["graph_schema"]
+
+    if _graph_schema_state["reloaded"] is not None:
+      return _graph_schema_state["reloaded"]
+
+    snapshot = snapshot_entry("graph_schema")
+    if snapshot:
+      return snapshot["schema"], snapshot["structured_schema"]
+
+    return _read_graph_schema()
+
+def get_graph_schema():
+    return _load_graph_schema()[0]
+
+def get_graph_structured_schema():
+    return _load_graph_schema()[1]
+
+def reload_graph_schema():
+    """
+    Reads the schema from Neo4j again and swaps it in once read, so callers
+    keep the previous one meanwhile. Blocks on Neo4j: call it from a thread.
+    """
+    if "graph_schema" not in get_backends():
+      _graph_schema_state["reloaded"] = _read_graph_schema(refresh=True)
+    _load_graph_schema.cache_clear()
+
+# Native async driver used for every query issued while serving requests, so
+# Cypher round trips don't block the event loop. Sessions are cheap and borrow
+# connections from the driver's shared pool.
+@lazy_resource
+def get_async_driver():
+    from neo4j import AsyncGraphDatabase # deferred, importing neo4j is slow
+
+    return AsyncGraphDatabase.driver(
+        os.environ["NEO4J_URI"],
+        auth=(os.environ["NEO4J_USERNAME"], os.environ["NEO4J_PASSWORD"]),
+        **NEO4J_DRIVER_CONFIG,
+    )
+
+def is_retryable(error):
+    """
+    Errors worth retrying; anything else (syntax errors, constraint violations)
+    is raised to the caller straight away.
+    """
+    from neo4j.exceptions import ServiceUnavailable, SessionExpired, TransientError
+
+    return isinstance(error, (ServiceUnavailable, SessionExpired, TransientError))
+
+_connectivity = {"verified": False}
+
+async def verify_connectivity():
+    """
+    Checks that the Neo4j server is reachable. Called once at startup and again
+    only after a query failed because of a connection problem.
+    """
+    if "run_query" not in get_backends() and not cassette.replaying:
+      await get_async_driver().verify_connectivity()
+    _connectivity["verified"] = True
+
+async def close_driver():
+    # Never built when every query went to a stand-in or the cassette
+    if get_async_driver.cache_info().currsize:
+      await get_async_driver().close()
+
+@retry(
+    stop=stop_after_attempt(3),
+    wait=wait_exponential(multiplier=2),
+    retry=retry_if_exception(is_retryable),
+    reraise=True,
 )
+async def _run_query(query, params=None):
+    # Recorded to, or answered from, the cassette when CASSETTE_MODE is set
+    return await cassette.run("query", [query, params or {}], lambda: _execute_query(query, params))
+
+async def _execute_query(query, params):
+    if "run_query" in get_backends():
+      records = await get_backends()["run_query"](query, params or {})
+      record_query(0.0, len(records))
+      return records
 
+    if not _connectivity["verified"]:
+      await verify_connectivity()
 
-graph_schema = enhanced_graph.schema
-graph_structured_schema = enhanced_graph.structured_schema
+    from neo4j.exceptions import ServiceUnavailable, SessionExpired
+
+    try:
+      async with get_async_driver().session(database=NEO4J_DATABASE) as session:
+        result = await session.run(query, params or {})
+        records = await result.data()
+        summary = await result.consume()
+        record_query(((summary.result_available_after or 0) + (summary.result_consumed_after or 0)) / 1000, len(records))
+        return records
+    except (ServiceUnavailable, SessionExpired):
+      _connectivity["verified"] = False
+      raise
 
-@retry(stop=stop_after_attempt(3), wait=wait_exponential(multiplier=2))
 async def safe_query(query, params=None):
-    enhanced_graph._driver.verify_connectivity()
+    # Identical reads already in flight (e.g. the same dish searched by
+    # concurrent users) are shared instead of run again
+    return await query_coalesced(_run_query, query, params)
 
-    if params:
-      return enhanced_graph.query(
-        query=query,
-        params=params
-      )
-    else:
-      return enhanced_graph.query(
-        query=query
-      )
+
+def emit_progress(event, **data):
+    """
+    Sends a progress event to /query/stream clients. A no-op outside a graph
+    run, or when the graph is not streaming custom events.
+    """
+    from langgraph.config import get_stream_writer # deferred, importing langgraph.config is slow
+
+    try:
+      writer = get_stream_writer()
+    except RuntimeError:
+      return
+    writer({"event": event, **data})
 
 
 # LLM_MODEL = "gemini-2.0-flash-001"
 LLM_MODEL = "gemini-2.5-flash-preview-04-17"
 
-llm = ChatGoogleGenerativeAI(
-    model=LLM_MODEL,
-    api_key=os.environ["GEMINI_API_KEY"],
-    temperature=0,  # Deterministic output
-    top_p=1.0       # Full probability distribution
-)
+# The Gemini clients are built on first use: importing langchain_google_genai
+# alone takes longer than the rest of the package.
+@lazy_resource
+def get_llm():
+    if "llm" in get_backends():
+      return get_backends()["llm"]
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    return ChatGoogleGenerativeAI(
+        model=LLM_MODEL,
+        api_key=os.environ["GEMINI_API_KEY"],
+        temperature=0,  # Deterministic output
+        top_p=1.0,      # Full probability distribution
+        # One attempt: a 429 goes straight back to the governor, which backs
+        # off for every caller, instead of being retried inside its slot
+        max_retries=1,
+    )
 
 EMBEDDING_MODEL = "models/embedding-001"
+EMBEDDING_TASK_TYPE = "semantic_similarity"
+
+@lazy_resource
+def get_embedding_model():
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    from .cache import LRUCache
+    from .embedding_cache import (
+        CachedEmbeddings, CassetteEmbeddings, EmbeddingStore, EMBEDDING_CACHE_DIR, QUERY_EMBEDDING_CACHE_SIZE,
+        QUERY_EMBEDDING_CACHE_TTL, QUERY_EMBEDDING_DISK_CACHE_DIR, QUERY_EMBEDDING_DISK_CACHE_SIZE,
+    )
+
+    embeddings = get_backends().get("embeddings")
+    # Stand-in vectors are cached under their own model key and directory, apart
+    # from Gemini's: a store only holds vectors of one width
+    model = EMBEDDING_MODEL if embeddings is None else f"{BACKEND_FACTORY}/{EMBEDDING_MODEL}"
+    store_dir = EMBEDDING_CACHE_DIR if embeddings is None else os.path.join(EMBEDDING_CACHE_DIR, "backends", BACKEND_FACTORY.replace(":", "."))
+    if embeddings is None:
+      embeddings = GoogleGenerativeAIEmbeddings(
+          model=EMBEDDING_MODEL, task_type=EMBEDDING_TASK_TYPE,
+          google_api_key=os.getenv("GEMINI_API_KEY"),
+      )
+    query_store_dir = QUERY_EMBEDDING_DISK_CACHE_DIR
+    if cassette.mode != "off":
+      embeddings = CassetteEmbeddings(embeddings, model)
+      # Recording and replay start from empty caches. Otherwise a recording
+      # made where vectors were cached would miss them when replayed elsewhere.
+      import atexit, shutil, tempfile
+
+      store_dir = tempfile.mkdtemp(prefix="zomato-cassette-embeddings-")
+      atexit.register(shutil.rmtree, store_dir, ignore_errors=True)
+      query_store_dir = None
 
-embedding_model = GoogleGenerativeAIEmbeddings(
-      model=EMBEDDING_MODEL, task_type="semantic_similarity",
-      google_api_key=os.getenv("GEMINI_API_KEY"),
+    # Document embeddings (few-shot examples, node texts) are cached on disk and
+    # shared between workers, so only new or edited texts hit the API. Query
+    # embeddings (dish searches) go through an LRU cache first.
+    return CachedEmbeddings(
+        embeddings,
+        store=EmbeddingStore(store_dir),
+        model=model,
+        task_type=EMBEDDING_TASK_TYPE,
+        query_cache=LRUCache(maxsize=QUERY_EMBEDDING_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL),
+        query_store=EmbeddingStore(
+            query_store_dir, max_rows=QUERY_EMBEDDING_DISK_CACHE_SIZE, ttl=QUERY_EMBEDDING_CACHE_TTL,
+        ) if query_store_dir else None,
     )
 
+def get_embedding_dimension():
+    """
+    Embedding size recorded in the snapshot, or None to let the vector stores
+    probe the embedding model for it.
+    """
+    snapshot = snapshot_entry("embedding")
+    if snapshot and snapshot["model"] == EMBEDDING_MODEL:
+      return snapshot["dimension"]
+    return None
+
+
+# The compiled graph, built on first use: importing langgraph and the nodes'
+# langchain chains takes longer than everything else a worker loads
+@lazy_resource
+def get_langgraph():
+    from .langgraph_agent import langgraph
+
+    return langgraph
+
 
 class InputState(TypedDict):
   question: str
@@ -79,6 +308,7 @@ class OverallState(TypedDict):
   cypher_statement: str
   cypher_errors: List[str]
   database_records: List[dict]
+  entities: Any # Entities extracted speculatively alongside the guardrail
   steps: Annotated[List[str], add]
 
 class OutputState(TypedDict):
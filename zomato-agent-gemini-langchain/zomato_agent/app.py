@@ -1,22 +1,184 @@
-from fastapi import FastAPI
-from pydantic import BaseModel
+import os
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse
+from pydantic import BaseModel, Field
 import uvicorn
-from .langgraph_agent import langgraph
+from . import verify_connectivity, close_driver, get_graph_schema, get_langgraph
+from .result_cache import RESULT_CACHE_SIZE, get_cached_result, set_cached_result, data_version_probe
+from .pagination import CursorError, CursorExpired, first_page, next_page
+from .streaming import stream_query, encode_ndjson, encode_sse
+from .governor import Overloaded
+from . import governor, singleflight
+from .tracing import metrics, start_trace, end_trace
+from .cassette import cassette
+from .general_query_agent.cypher_cache import CYPHER_CACHE_SIZE, schema_probe
+from .parameter_based_agent.generate_parameter_based_cypher import prewarm_plan_cache
 
-app = FastAPI()
+# Resources are built lazily on first use. Set WARMUP_ON_STARTUP=true to build
+# them in a background thread right after startup instead; the worker still
+# starts accepting requests immediately. The graph itself, which needs no
+# network, is always built that way.
+WARMUP_ON_STARTUP = os.getenv("WARMUP_ON_STARTUP", "false").lower() == "true"
+
+# EXPLAIN every parameter-based Cypher shape in the background at startup, so
+# Neo4j's plan cache is warm before the first order
+PREWARM_CYPHER_PLANS = os.getenv("PREWARM_CYPHER_PLANS", "false").lower() == "true"
+# At most this many shapes, simplest first (0: all of them)
+PREWARM_CYPHER_PLANS_LIMIT = int(os.getenv("PREWARM_CYPHER_PLANS_LIMIT", "512"))
+
+def warm_up():
+    from .parameter_based_agent.entities import get_entity_example_selector
+    from .general_query_agent.generate_cypher import get_example_selector
+    from .general_query_agent.validate_cypher import get_cypher_query_corrector
+
+    get_graph_schema()
+    get_cypher_query_corrector()
+    get_entity_example_selector()
+    get_example_selector()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connectivity is checked once here instead of before every query
+    await verify_connectivity()
+    app.state.graph_task = asyncio.create_task(asyncio.to_thread(get_langgraph))
+    if WARMUP_ON_STARTUP:
+      app.state.warm_up_task = asyncio.create_task(asyncio.to_thread(warm_up))
+    if PREWARM_CYPHER_PLANS:
+      app.state.prewarm_task = asyncio.create_task(prewarm_plan_cache(limit=PREWARM_CYPHER_PLANS_LIMIT or None))
+    # Clears the Cypher cache when the graph schema changes
+    if CYPHER_CACHE_SIZE > 0:
+      app.state.schema_probe_task = asyncio.create_task(schema_probe())
+    # Clears the result cache when the graph data changes
+    if RESULT_CACHE_SIZE > 0:
+      app.state.data_version_probe_task = asyncio.create_task(data_version_probe())
+    yield
+    # Startup tasks still running would otherwise query a closed driver; a
+    # task in a worker thread can't be interrupted, so it is waited for
+    tasks = [getattr(app.state, name) for name in ("graph_task", "warm_up_task", "prewarm_task", "schema_probe_task", "data_version_probe_task") if hasattr(app.state, name)]
+    for task in tasks:
+      task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+    await close_driver()
+    cassette.close()
+
+app = FastAPI(lifespan=lifespan)
 
 class UserInput(BaseModel):
-    query: str
-    threshold: float
+    query: Optional[str] = None
+    threshold: Optional[float] = None
+    # With page_size set, only the first page of records is returned along with
+    # a `next_cursor`; pass that cursor (query and threshold not needed) to get
+    # the next page from the stored result.
+    page_size: Optional[int] = Field(default=None, gt=0)
+    cursor: Optional[str] = None
+    # Return the per-node spans (wall time, tokens, Neo4j time and rows,
+    # cache hits) of this run under `trace`
+    trace: bool = False
+
+async def run_query(question, passing_threshold):
+    cached_result = await get_cached_result(question, passing_threshold)
+    if cached_result is not None:
+      return {**cached_result, "steps": cached_result["steps"] + ["result_cache"]}
+
+    result = await get_langgraph().ainvoke({
+        "question": question,
+        "passing_threshold": passing_threshold
+    })
+
+    await set_cached_result(question, passing_threshold, result)
+    return result
 
 @app.post("/query")
 async def handle_query(user_input: UserInput):
-    result = await langgraph.ainvoke({
-        "question": user_input.query,
-        "passing_threshold": user_input.threshold
-    })
+    if user_input.cursor:
+      try:
+        return next_page(user_input.cursor, user_input.page_size)
+      except CursorExpired as e:
+        raise HTTPException(status_code=410, detail=str(e))
+      except CursorError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    if user_input.query is None or user_input.threshold is None:
+      raise HTTPException(status_code=422, detail="query and threshold are required without a cursor")
+
+    # Backpressure: when the Gemini governor's queue is full, shed the request
+    # instead of letting it wait behind the others
+    trace, token = start_trace()
+    try:
+      result = await run_query(user_input.query, user_input.threshold)
+    except Overloaded as e:
+      raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(round(e.retry_after))})
+    finally:
+      end_trace(trace, token)
+
+    if user_input.trace:
+      result = {**result, "trace": trace.to_dict()}
+
+    if user_input.page_size:
+      return first_page(result, user_input.page_size)
     return result
 
+class StreamInput(BaseModel):
+    query: str
+    threshold: float
+
+@app.post("/query/stream")
+async def handle_query_stream(user_input: StreamInput, request: Request):
+    """
+    Streams node completions, progress and record batches as they happen:
+    NDJSON by default, server-sent events when the client accepts
+    text/event-stream.
+    """
+    if "text/event-stream" in request.headers.get("accept", ""):
+      encode, media_type = encode_sse, "text/event-stream"
+    else:
+      encode, media_type = encode_ndjson, "application/x-ndjson"
+
+    async def body():
+        # Traced like /query; the trace ends when the stream does, also when
+        # the client disconnects
+        trace, token = start_trace()
+        try:
+          async for event in stream_query(user_input.query, user_input.threshold):
+              yield encode(event)
+        finally:
+          end_trace(trace, token)
+
+    return StreamingResponse(body(), media_type=media_type, headers={"Cache-Control": "no-cache"})
+
+def summary_gauges():
+    """
+    The in-process counters of the fast paths, the single-flight layers and
+    the governors (and the cassette, when recording or replaying), as (name,
+    help, labels, value) gauges.
+    """
+    from .guardrails import guardrails_stats
+    from .general_query_agent.validate_cypher import validation_stats
+
+    for stage, stats in [("guardrails", guardrails_stats), ("validate_cypher", validation_stats)]:
+        summary = stats.summary()
+        yield "zomato_fast_path_llm_calls", "LLM calls made by a stage with a local fast path.", {"stage": stage}, summary["llm_calls"]
+        yield "zomato_fast_path_llm_calls_avoided", "LLM calls a local fast path settled on its own.", {"stage": stage}, summary["llm_calls_avoided"]
+
+    for layer, summary in singleflight.summary().items():
+        yield "zomato_singleflight_calls", "Calls started by a single-flight layer.", {"layer": layer}, summary["calls"]
+        yield "zomato_singleflight_merged", "Calls that joined an identical call in flight.", {"layer": layer}, summary["merged"]
+
+    for name, summary in governor.summary().items():
+        for key in ["active", "waiting", "concurrency_limit", "rejected", "rate_limited"]:
+            yield f"zomato_governor_{key}", f"Governor {key.replace('_', ' ')}.", {"governor": name}, summary[key]
+
+    if cassette.mode != "off":
+      for key in ["recorded", "replayed", "missed"]:
+          yield "zomato_cassette_calls", "Calls recorded to or replayed from the cassette.", {"mode": cassette.mode, "result": key}, cassette.stats[key]
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def handle_metrics():
+    return PlainTextResponse(metrics.render(gauges=summary_gauges()), media_type="text/plain; version=0.0.4")
+
 # Optional for local testing
 if __name__ == "__main__":
     uvicorn.run("zomato_agent.app:app", host="0.0.0.0", port=8080)
\ No newline at end of file
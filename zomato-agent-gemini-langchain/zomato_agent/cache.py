@@ -0,0 +1,152 @@
+import re
+import time
+import threading
+import numpy as np
+from collections import OrderedDict
+
+
+def normalize_question(question):
+    """
+    Canonical form of a user question used as a cache key: lowercase, with
+    punctuation and repeated whitespace collapsed.
+    """
+    return re.sub(r"[^\w]+", " ", (question or "").lower()).strip()
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache with an optional time-to-live.
+
+    Holds at most `maxsize` entries, evicting the least recently used one when
+    full. With `ttl` (seconds) set, entries older than that are treated as misses.
+    """
+
+    def __init__(self, maxsize, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+
+    def get(self, key, default=None):
+        with self._lock:
+          entry = self._entries.get(key)
+          if entry is None:
+            self.stats["misses"] += 1
+            return default
+
+          value, stored_at = entry
+          if self.ttl and time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            self.stats["expirations"] += 1
+            self.stats["misses"] += 1
+            return default
+
+          self._entries.move_to_end(key)
+          self.stats["hits"] += 1
+          return value
+
+    def set(self, key, value):
+        if self.maxsize <= 0:
+          return
+
+        with self._lock:
+          self._entries[key] = (value, time.monotonic())
+          self._entries.move_to_end(key)
+          while len(self._entries) > self.maxsize:
+              self._entries.popitem(last=False)
+              self.stats["evictions"] += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+          entry = self._entries.pop(key, None)
+          return default if entry is None else entry[0]
+
+    def clear(self):
+        with self._lock:
+          self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SemanticCache:
+    """
+    LRUCache keyed by (namespace, normalized question) that can also match
+    near-duplicate questions within the same namespace.
+
+    When `similarity_threshold` is set and an `embed` coroutine is passed to
+    `aget`/`aset`, a miss on the exact key falls back to the cached question
+    whose embedding has the highest cosine similarity, if it reaches the
+    threshold.
+    """
+
+    def __init__(self, maxsize, ttl=None, similarity_threshold=None):
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+        self.similarity_threshold = similarity_threshold
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "similar_hits": 0, "misses": 0}
+
+    def _nearest(self, namespace, vector):
+        with self._lock:
+          candidates = [
+              (key, stored) for key, stored in self._vectors.items()
+              if key[0] == namespace
+          ]
+
+        if not candidates:
+          return None
+
+        matrix = np.asarray([stored for _, stored in candidates], dtype=np.float32)
+        query = np.asarray(vector, dtype=np.float32)
+        similarities = matrix @ query / (np.linalg.norm(matrix, axis=1) * np.linalg.norm(query) + 1e-12)
+
+        best = int(np.argmax(similarities))
+        if similarities[best] < self.similarity_threshold:
+          return None
+        return candidates[best][0]
+
+    def _semantic(self, embed):
+        return embed is not None and self.similarity_threshold is not None
+
+    async def aget(self, question, namespace, embed=None):
+        key = (namespace, normalize_question(question))
+
+        value = self.entries.get(key)
+        if value is not None:
+          self.stats["exact_hits"] += 1
+          return value
+
+        if self._semantic(embed):
+          nearest_key = self._nearest(namespace, await embed(key[1]))
+          if nearest_key is not None:
+            value = self.entries.get(nearest_key)
+            if value is not None:
+              self.stats["similar_hits"] += 1
+              return value
+
+            # Evicted or expired: forget its vector too
+            with self._lock:
+              self._vectors.pop(nearest_key, None)
+
+        self.stats["misses"] += 1
+        return None
+
+    async def aset(self, question, namespace, value, embed=None):
+        key = (namespace, normalize_question(question))
+        self.entries.set(key, value)
+
+        if self._semantic(embed):
+          vector = await embed(key[1])
+          with self._lock:
+            self._vectors[key] = vector
+            self._vectors.move_to_end(key)
+            # Keep at most one vector per entry the LRU can still hold
+            while len(self._vectors) > self.entries.maxsize:
+                self._vectors.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        with self._lock:
+          self._vectors.clear()
@@ -0,0 +1,175 @@
+"""
+Record/replay of the calls that leave the process.
+
+With CASSETTE_MODE=record every LLM chain call, embedding call, Neo4j query
+and the graph schema load is run as usual and written to CASSETTE_PATH (gzip
+JSON lines: kind, key, inputs, output and the seconds the call took). With
+CASSETTE_MODE=replay the same calls are answered from the cassette instead,
+after the recorded latency or straight away with CASSETTE_LATENCY=zero. A call
+that was not recorded raises CassetteMiss rather than reaching the network.
+
+Replaying a recorded trace through `langgraph` repeats the upstream behaviour
+exactly, so two builds can be compared on the same inputs, and with zero
+latency what is left is the package's own time.
+
+Calls are matched on their inputs. A call recorded several times is replayed
+in recording order, the last answer repeating once the others are used up.
+Recording appends to the file and is meant for a single worker; delete the
+file to start over.
+"""
+import os
+import json
+import gzip
+import time
+import base64
+import atexit
+import asyncio
+import hashlib
+import importlib
+import threading
+import numpy as np
+from collections import deque
+from pydantic import BaseModel
+
+
+CURRENT_DIR = os.path.dirname(__file__)
+
+# off, record or replay
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "off").lower()
+CASSETTE_PATH = os.getenv("CASSETTE_PATH", os.path.join(CURRENT_DIR, "cache", "cassette.jsonl.gz"))
+# recorded or zero
+CASSETTE_LATENCY = os.getenv("CASSETTE_LATENCY", "recorded").lower()
+
+
+class CassetteMiss(LookupError):
+    """
+    Replay mode was asked for a call the cassette does not hold.
+    """
+
+
+def _dumps(value):
+    return json.dumps(value, sort_keys=True, default=str)
+
+def _encode(kind, value):
+    if kind == "embedding":
+      # float32 rows, base64: a third of the size of JSON floats
+      matrix = np.asarray(value, dtype=np.float32)
+      return {"shape": matrix.shape, "vectors": base64.b64encode(matrix.tobytes()).decode("ascii")}
+    if isinstance(value, BaseModel):
+      return {"model": f"{type(value).__module__}:{type(value).__qualname__}", "value": value.model_dump(mode="json")}
+    return {"value": value}
+
+def _decode(output):
+    if "vectors" in output:
+      return np.frombuffer(base64.b64decode(output["vectors"]), dtype=np.float32).reshape(output["shape"]).tolist()
+    if "model" in output:
+      module_name, _, qualname = output["model"].partition(":")
+      model = importlib.import_module(module_name)
+      for name in qualname.split("."):
+          model = getattr(model, name)
+      return model.model_validate(output["value"])
+    return output["value"]
+
+
+class Cassette:
+    def __init__(self, mode, path, latency="recorded"):
+        self.mode = mode
+        self.path = path
+        self.latency = latency
+        self._lock = threading.Lock()
+        self._file = None
+        self._recordings = None
+        self.stats = {"recorded": 0, "replayed": 0, "missed": 0}
+
+    @property
+    def recording(self):
+        return self.mode == "record"
+
+    @property
+    def replaying(self):
+        return self.mode == "replay"
+
+    @staticmethod
+    def key(kind, inputs):
+        return hashlib.sha256(_dumps([kind, inputs]).encode("utf-8")).hexdigest()
+
+    def _write(self, kind, key, inputs, seconds, output):
+        line = _dumps({"kind": kind, "key": key, "inputs": inputs, "seconds": round(seconds, 6), "output": _encode(kind, output)})
+        with self._lock:
+          if self._file is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._file = gzip.open(self.path, "at", encoding="utf-8")
+          self._file.write(line + "\n")
+          self.stats["recorded"] += 1
+
+    def _load(self):
+        recordings = {}
+        with gzip.open(self.path, "rt", encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                  entry = json.loads(line)
+                  recordings.setdefault(entry["key"], deque()).append((entry["seconds"], entry["output"]))
+        return recordings
+
+    def _next(self, kind, key):
+        with self._lock:
+          if self._recordings is None:
+            self._recordings = self._load()
+
+          recorded = self._recordings.get(key)
+          if not recorded:
+            self.stats["missed"] += 1
+            raise CassetteMiss(f"No {kind} call with key {key[:12]} in {self.path}")
+
+          seconds, output = recorded.popleft() if len(recorded) > 1 else recorded[0]
+          self.stats["replayed"] += 1
+
+        return (seconds if self.latency == "recorded" else 0.0), _decode(output)
+
+    async def run(self, kind, inputs, call):
+        """
+        Awaits call(), recording it, or answers from the cassette, depending on
+        the mode. `inputs` (JSON-serialisable) identify the call.
+        """
+        if self.replaying:
+          seconds, output = self._next(kind, self.key(kind, inputs))
+          if seconds:
+            await asyncio.sleep(seconds)
+          return output
+
+        if not self.recording:
+          return await call()
+
+        start = time.perf_counter()
+        output = await call()
+        self._write(kind, self.key(kind, inputs), inputs, time.perf_counter() - start, output)
+        return output
+
+    def run_sync(self, kind, inputs, call):
+        if self.replaying:
+          seconds, output = self._next(kind, self.key(kind, inputs))
+          if seconds:
+            time.sleep(seconds)
+          return output
+
+        if not self.recording:
+          return call()
+
+        start = time.perf_counter()
+        output = call()
+        self._write(kind, self.key(kind, inputs), inputs, time.perf_counter() - start, output)
+        return output
+
+    def close(self):
+        with self._lock:
+          if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def summary(self):
+        return {"mode": self.mode, **self.stats}
+
+
+cassette = Cassette(CASSETTE_MODE, CASSETTE_PATH, CASSETTE_LATENCY)
+atexit.register(cassette.close)
+
@@ -0,0 +1,333 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import threading
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from .cache import LRUCache
+from .singleflight import SINGLE_FLIGHT, embedding_flight
+from .governor import embedding_governor, estimate_tokens
+from .tracing import record_cache
+from .cassette import cassette
+
+try:
+    import fcntl
+except ImportError: # Windows: no cross-process locking, single worker assumed
+    fcntl = None
+
+
+CURRENT_DIR = os.path.dirname(__file__)
+EMBEDDING_CACHE_DIR = os.getenv("EMBEDDING_CACHE_DIR", os.path.join(CURRENT_DIR, "cache", "embeddings"))
+
+# Query embeddings: in-process LRU, plus an optional on-disk tier shared by all
+# workers on the host (disabled unless QUERY_EMBEDDING_DISK_CACHE_DIR is set),
+# holding at most QUERY_EMBEDDING_DISK_CACHE_SIZE vectors. Both tiers expire
+# vectors after QUERY_EMBEDDING_CACHE_TTL seconds.
+QUERY_EMBEDDING_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_CACHE_SIZE", "2048"))
+QUERY_EMBEDDING_CACHE_TTL = float(os.getenv("QUERY_EMBEDDING_CACHE_TTL", "86400"))
+QUERY_EMBEDDING_DISK_CACHE_DIR = os.getenv("QUERY_EMBEDDING_DISK_CACHE_DIR")
+QUERY_EMBEDDING_DISK_CACHE_SIZE = int(os.getenv("QUERY_EMBEDDING_DISK_CACHE_SIZE", "100000"))
+
+
+def embedding_key(model, task_type, text):
+    return hashlib.sha256(json.dumps([model, task_type, text]).encode('utf-8')).hexdigest()
+
+class EmbeddingStore:
+    """
+    Append-only, content-addressed store of embeddings on disk.
+
+    The vectors file (`vectors.f32` unless the index names another) holds one
+    float32 row per embedding and is memory-mapped for reads. `index.json` maps
+    each key to its row and the time it was written. Writers from different
+    worker processes are serialised with an exclusive lock on `lock`.
+
+    With `ttl`, rows older than that are not returned. With `max_rows`, once the
+    file grows past that many rows the newest fresh ones are copied to a new
+    vectors file and the index is switched to it, so a reader never maps a file
+    that is being rewritten.
+    """
+
+    def __init__(self, directory, max_rows=None, ttl=None):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.json")
+        self.lock_path = os.path.join(directory, "lock")
+        self.max_rows = max_rows
+        self.ttl = ttl
+
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._written = {}
+        self._size = 0
+        self._dimension = None
+        self._vectors_file = "vectors.f32"
+        self._vectors = None
+        self._index_mtime = None
+
+    def _refresh(self):
+        # Picks up rows appended by other workers since the last read
+        try:
+          index_mtime = os.stat(self.index_path).st_mtime_ns
+        except FileNotFoundError:
+          return
+
+        if index_mtime == self._index_mtime:
+          return
+
+        with open(self.index_path, 'r') as f:
+            index = json.load(f)
+
+        self._rows = index["rows"]
+        self._written = index.get("written", {})
+        self._size = index.get("size", len(self._rows))
+        self._dimension = index["dimension"]
+        self._vectors_file = index.get("vectors", "vectors.f32")
+        self._vectors = np.memmap(
+            os.path.join(self.directory, self._vectors_file), dtype=np.float32, mode='r', shape=(self._size, self._dimension)
+        ) if self._size else None
+        self._index_mtime = index_mtime
+
+    def _fresh(self, key, now):
+        return self.ttl is None or now - self._written.get(key, 0) <= self.ttl
+
+    def get_many(self, keys):
+        now = time.time()
+        with self._lock:
+          self._refresh()
+          return {
+              key: self._vectors[self._rows[key]].tolist()
+              for key in keys if key in self._rows and self._fresh(key, now)
+          }
+
+    def _write_index(self, index):
+        temp_index_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(temp_index_path, 'w') as f:
+            json.dump(index, f)
+        os.replace(temp_index_path, self.index_path)
+
+    def _compact(self, dimension, now):
+        # Keeps the newest three quarters of max_rows, so the next compaction
+        # is many writes away
+        keep = sorted(
+            (key for key in self._rows if self._fresh(key, now)), key=lambda key: self._written.get(key, 0), reverse=True
+        )[:self.max_rows * 3 // 4]
+
+        old_vectors_path = os.path.join(self.directory, self._vectors_file)
+        old_vectors = np.memmap(old_vectors_path, dtype=np.float32, mode='r', shape=(self._size, dimension))
+        vectors_file = f"vectors.{time.time_ns()}.f32"
+        with open(os.path.join(self.directory, vectors_file), 'wb') as f:
+            f.write(np.ascontiguousarray(old_vectors[[self._rows[key] for key in keep]]).tobytes())
+        del old_vectors
+
+        self._write_index({
+            "dimension": dimension,
+            "size": len(keep),
+            "vectors": vectors_file,
+            "rows": {key: i for i, key in enumerate(keep)},
+            "written": {key: self._written[key] for key in keep if key in self._written},
+        })
+        # Readers that still map the old file keep it alive until they refresh
+        try:
+          os.remove(old_vectors_path)
+        except OSError: # Windows: mapped files can't be removed
+          pass
+
+    def put_many(self, vectors_by_key):
+        os.makedirs(self.directory, exist_ok=True)
+        now = time.time()
+
+        with self._lock, open(self.lock_path, 'a') as lock_file:
+          if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+
+          self._index_mtime = None
+          self._refresh()
+
+          new_vectors = {
+              key: vector for key, vector in vectors_by_key.items()
+              if key not in self._rows or not self._fresh(key, now)
+          }
+          if not new_vectors:
+            return
+
+          matrix = np.asarray(list(new_vectors.values()), dtype=np.float32)
+          dimension = self._dimension or matrix.shape[1]
+          # Rows of another width would shift every row after them
+          if matrix.ndim != 2 or matrix.shape[1] != dimension:
+            raise ValueError(
+                f"{self.directory} holds {dimension}-d embeddings, got {matrix.shape[-1]}-d; "
+                "use a separate EMBEDDING_CACHE_DIR per embedding model"
+            )
+          start = self._size
+
+          with open(os.path.join(self.directory, self._vectors_file), 'ab') as f:
+              # Drop rows a crashed writer appended without recording them in the index
+              f.truncate(start * dimension * matrix.itemsize)
+              f.write(matrix.tobytes())
+
+          # Expired keys written again point at their new row; the old one is
+          # dropped at the next compaction
+          self._rows = {**self._rows, **{key: start + i for i, key in enumerate(new_vectors)}}
+          self._written = {**self._written, **{key: now for key in new_vectors}}
+          self._size = start + len(new_vectors)
+
+          if self.max_rows and self._size > self.max_rows:
+            self._compact(dimension, now)
+          else:
+            self._write_index({
+                "dimension": dimension,
+                "size": self._size,
+                "vectors": self._vectors_file,
+                "rows": self._rows,
+                "written": self._written,
+            })
+
+          self._index_mtime = None
+          self._refresh()
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embeddings wrapper that serves document embeddings from an EmbeddingStore,
+    keyed by (model, task_type, text), and only sends unseen texts to the model.
+
+    Query embeddings are looked up in `query_cache` (an LRUCache) and then in the
+    optional `query_store` before calling the model, so repeated searches for the
+    same dish skip the API round trip. On the async path the disk is read in a
+    thread, and new vectors are written to it in batches by a background task.
+    """
+
+    def __init__(self, embeddings, store, model, task_type, query_cache=None, query_store=None):
+        self.embeddings = embeddings
+        self.store = store
+        self.model = model
+        self.task_type = task_type
+        self.query_cache = query_cache if query_cache is not None else LRUCache(maxsize=0)
+        self.query_store = query_store
+        self.stats = {"hits": 0, "misses": 0, "query_hits": 0, "query_disk_hits": 0, "query_misses": 0}
+        self._pending_writes = {}
+        self._write_task = None
+
+    def _lookup(self, texts):
+        keys = [embedding_key(self.model, self.task_type, text) for text in texts]
+        cached = self.store.get_many(keys)
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+              missing[key] = text
+
+        self.stats["hits"] += len(texts) - len(missing)
+        self.stats["misses"] += len(missing)
+        return keys, cached, missing
+
+    def _store(self, cached, missing, vectors):
+        new_vectors = dict(zip(missing.keys(), vectors))
+        self.store.put_many(new_vectors)
+        cached.update(new_vectors)
+
+    def embed_documents(self, texts):
+        keys, cached, missing = self._lookup(texts)
+        if missing:
+          self._store(cached, missing, self.embeddings.embed_documents(list(missing.values())))
+
+        return [cached[key] for key in keys]
+
+    async def aembed_documents(self, texts):
+        keys, cached, missing = self._lookup(texts)
+        if missing:
+          self._store(cached, missing, await self.embeddings.aembed_documents(list(missing.values())))
+
+        return [cached[key] for key in keys]
+
+    def _lookup_memory(self, text):
+        key = embedding_key(self.model, self.task_type, text)
+
+        vector = self.query_cache.get(key)
+        if vector is not None:
+          self.stats["query_hits"] += 1
+          record_cache("query_embedding", True)
+        return key, vector
+
+    def _found_on_disk(self, key, vector):
+        if vector is not None:
+          self.stats["query_disk_hits"] += 1
+          record_cache("query_embedding", True)
+          self.query_cache.set(key, vector)
+          return vector
+
+        self.stats["query_misses"] += 1
+        record_cache("query_embedding", False)
+        return None
+
+    async def _write_pending(self):
+        # Vectors that arrive while a batch is being written go in the next one
+        while self._pending_writes:
+            batch, self._pending_writes = self._pending_writes, {}
+            try:
+              await asyncio.to_thread(self.query_store.put_many, batch)
+            except Exception as e:
+              print(f"Writing query embeddings to disk failed: {e}")
+
+    def _store_query_later(self, key, vector):
+        self.query_cache.set(key, vector)
+        if not self.query_store:
+          return
+
+        self._pending_writes[key] = vector
+        loop = asyncio.get_running_loop()
+        if self._write_task is None or self._write_task.done() or self._write_task.get_loop() is not loop:
+          self._write_task = loop.create_task(self._write_pending())
+
+    def embed_query(self, text):
+        key, vector = self._lookup_memory(text)
+        if vector is None:
+          vector = self._found_on_disk(key, self.query_store.get_many([key]).get(key) if self.query_store else None)
+
+        if vector is None:
+          vector = self.embeddings.embed_query(text)
+          self.query_cache.set(key, vector)
+          if self.query_store:
+            self.query_store.put_many({key: vector})
+
+        return vector
+
+    async def aembed_query(self, text):
+        key, vector = self._lookup_memory(text)
+        if vector is None:
+          on_disk = (await asyncio.to_thread(self.query_store.get_many, [key])).get(key) if self.query_store else None
+          vector = self._found_on_disk(key, on_disk)
+
+        if vector is None:
+          def call():
+              return embedding_governor.run(
+                  "embedding", lambda: self.embeddings.aembed_query(text), tokens=estimate_tokens(text, output_tokens=0)
+              )
+
+          vector = await (embedding_flight.do(key, call) if SINGLE_FLIGHT else call())
+          self._store_query_later(key, vector)
+
+        return vector
+
+
+class CassetteEmbeddings(Embeddings):
+    """
+    Routes an embeddings model's calls through the cassette, keyed by `model`
+    and the texts.
+    """
+
+    def __init__(self, embeddings, model):
+        self.embeddings = embeddings
+        self.model = model
+
+    def embed_documents(self, texts):
+        return cassette.run_sync("embedding", ["documents", self.model, texts], lambda: self.embeddings.embed_documents(texts))
+
+    async def aembed_documents(self, texts):
+        return await cassette.run("embedding", ["documents", self.model, texts], lambda: self.embeddings.aembed_documents(texts))
+
+    def embed_query(self, text):
+        return cassette.run_sync("embedding", ["query", self.model, text], lambda: self.embeddings.embed_query(text))
+
+    async def aembed_query(self, text):
+        return await cassette.run("embedding", ["query", self.model, text], lambda: self.embeddings.aembed_query(text))
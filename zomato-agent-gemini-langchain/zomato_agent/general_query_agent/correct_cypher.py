@@ -1,6 +1,9 @@
+import asyncio
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from .. import OverallState, llm, graph_schema
+from .. import OverallState, get_llm, get_graph_schema, lazy_resource
+from ..graph_migrations import migrated_properties, use_lowercase_properties
+from ..singleflight import ainvoke_coalesced
 
 
 correct_cypher_prompt = ChatPromptTemplate.from_messages(
@@ -42,22 +45,28 @@ Corrected Cypher statement: """
     ]
 )
 
-correct_cypher_chain = correct_cypher_prompt | llm | StrOutputParser()
+@lazy_resource
+def get_correct_cypher_chain():
+    return correct_cypher_prompt | get_llm() | StrOutputParser()
 
 async def correct_cypher(state: OverallState) -> OverallState:
     """
     Correct the Cypher statement based on the provided errors.
     """
 
-    corrected_cypher = await correct_cypher_chain.ainvoke(
+    corrected_cypher = await ainvoke_coalesced(
+        get_correct_cypher_chain(),
         {
             "question": state.get("question"),
             "errors": state.get("cypher_errors"),
             "cypher": state.get("cypher_statement"),
-            "schema": graph_schema,
-        }
+            "schema": get_graph_schema(),
+        },
+        priority="correct_cypher",
     )
 
+    corrected_cypher = use_lowercase_properties(corrected_cypher, await asyncio.to_thread(migrated_properties))
+
     return {
         "next_action": "validate_cypher",
         "cypher_statement": corrected_cypher,
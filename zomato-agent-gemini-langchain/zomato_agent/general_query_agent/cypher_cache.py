@@ -0,0 +1,102 @@
+import os
+import json
+import asyncio
+import hashlib
+from .. import safe_query, reload_graph_schema, get_embedding_model
+from ..cache import SemanticCache
+from ..graph_migrations import migrated_properties
+from ..tracing import record_cache
+
+
+# Validated Cypher statements by normalized question, so a repeated question
+# skips generate_cypher's, validate_cypher's and correct_cypher's LLM calls
+CYPHER_CACHE_SIZE = int(os.getenv("CYPHER_CACHE_SIZE", "1024"))
+CYPHER_CACHE_TTL = float(os.getenv("CYPHER_CACHE_TTL", "86400"))
+
+# Cosine similarity above which a differently worded question reuses a cached
+# statement, e.g. 0.98. Keep it high: "top 5" and "top 10" questions embed
+# almost identically. Unset: only questions that normalize identically match.
+CYPHER_CACHE_SIMILARITY = os.getenv("CYPHER_CACHE_SIMILARITY")
+
+cypher_cache = SemanticCache(
+    maxsize=CYPHER_CACHE_SIZE,
+    ttl=CYPHER_CACHE_TTL,
+    similarity_threshold=float(CYPHER_CACHE_SIMILARITY) if CYPHER_CACHE_SIMILARITY else None,
+)
+
+# The live schema is probed every CYPHER_SCHEMA_CHECK_INTERVAL seconds by a
+# background task started in app.py. The probe reads the label, relationship
+# type and property key tokens, which Neo4j answers without touching the data.
+CYPHER_SCHEMA_CHECK_INTERVAL = float(os.getenv("CYPHER_SCHEMA_CHECK_INTERVAL", "300"))
+SCHEMA_VERSION_QUERY = (
+    "CALL db.labels() YIELD label WITH collect(label) AS labels "
+    "CALL db.relationshipTypes() YIELD relationshipType WITH labels, collect(relationshipType) AS types "
+    "CALL db.propertyKeys() YIELD propertyKey RETURN labels, types, collect(propertyKey) AS properties"
+)
+
+_schema_version = {"value": None}
+
+def _schema_changed():
+    # Everything built from the old schema is rebuilt here, in the probe's
+    # thread, so no request waits on the schema read or the rebuild
+    from .validate_cypher import get_cypher_query_corrector, get_value_mapping_query
+
+    reload_graph_schema()
+    for resource in [get_cypher_query_corrector, get_value_mapping_query, migrated_properties]:
+        resource.cache_clear()
+        resource()
+    cypher_cache.clear()
+
+async def refresh_schema_version():
+    """
+    Probes the live schema and, when it differs from the one seen previously,
+    reloads the schema the prompts and checks use and clears the cache.
+    """
+    records = await safe_query(query=SCHEMA_VERSION_QUERY)
+    tokens = {key: sorted(value) for key, value in records[0].items()} if records else {}
+    version = hashlib.sha256(json.dumps(tokens, sort_keys=True, default=str).encode()).hexdigest()
+
+    if _schema_version["value"] is not None and version != _schema_version["value"]:
+      print("Graph schema changed, clearing the Cypher cache")
+      await asyncio.to_thread(_schema_changed)
+
+    _schema_version["value"] = version
+
+async def schema_probe():
+    while True:
+        try:
+          await refresh_schema_version()
+        except Exception as e:
+          print(f"Graph schema probe failed: {e}")
+        await asyncio.sleep(CYPHER_SCHEMA_CHECK_INTERVAL)
+
+async def get_schema_version():
+    """
+    The last probed schema version, plus the migrated properties the
+    statements were rewritten for. Probes inline only before the first
+    background probe has finished.
+    """
+    if _schema_version["value"] is None:
+      await refresh_schema_version()
+
+    migrated = await asyncio.to_thread(migrated_properties)
+    return f"{_schema_version['value']}:{sorted(migrated)}"
+
+async def _embed(text):
+    return await get_embedding_model().aembed_query(text)
+
+async def get_cached_cypher(question):
+    if CYPHER_CACHE_SIZE <= 0:
+      return None
+
+    namespace = await get_schema_version()
+    cached_cypher = await cypher_cache.aget(question, namespace, embed=_embed)
+    record_cache("cypher", cached_cypher is not None)
+    return cached_cypher
+
+async def set_cached_cypher(question, cypher_statement):
+    if CYPHER_CACHE_SIZE <= 0 or not cypher_statement:
+      return
+
+    namespace = await get_schema_version()
+    await cypher_cache.aset(question, namespace, cypher_statement, embed=_embed)
@@ -0,0 +1,164 @@
+"""
+Deterministic checks of a generated Cypher statement against the graph's
+structured schema, so that validate_cypher only asks the LLM when they can't
+settle it.
+
+Patterns and property accesses are found with regular expressions after the
+string literals are masked. The checks are deliberately lenient: a variable
+whose label can't be read from the statement is not checked, and relationship
+directions are left to CypherQueryCorrector.
+"""
+import re
+import difflib
+
+
+LITERAL = re.compile(r"'(?:[^'\\]|\\.)*'|\"(?:[^\"\\]|\\.)*\"")
+COMMENT = re.compile(r"//[^\n]*")
+
+NAME = r"(?:`[^`]+`|[A-Za-z_]\w*)"
+
+NODE_PATTERN = re.compile(
+    rf"(?<![\w.`])\(\s*(?P<variable>{NAME})?\s*(?P<labels>(?::\s*{NAME}\s*)+)?(?P<props>\{{[^{{}}]*\}})?\s*\)"
+)
+RELATIONSHIP_PATTERN = re.compile(
+    rf"-\[\s*(?P<variable>{NAME})?\s*(?::\s*(?P<types>{NAME}(?:\s*\|\s*:?\s*{NAME})*))?[^\]]*?(?P<props>\{{[^{{}}]*\}})?[^\]]*\]-"
+)
+PROPERTY_ACCESS = re.compile(rf"(?<![\w.$`])(?P<variable>{NAME})\s*\.\s*(?P<property>{NAME})")
+MAP_KEY = re.compile(rf"(?P<key>{NAME})\s*:")
+MAP_PROJECTION = re.compile(rf"(?<![\w:`])(?P<variable>{NAME})\s*\{{(?P<items>[^{{}}]*)\}}")
+PROJECTED_PROPERTY = re.compile(rf"(?:^|,)\s*\.\s*(?P<property>{NAME})")
+
+EQUALITY_FILTER = re.compile(
+    rf"(?:toLower\(\s*)?(?P<variable>{NAME})\.(?P<property>{NAME})\s*\)?\s*=\s*(?:toLower\(\s*)?\$__literal_(?P<literal>\d+)\b"
+)
+INLINE_FILTER = re.compile(rf"(?P<key>{NAME})\s*:\s*\$__literal_(?P<literal>\d+)\b")
+
+def _name(name):
+    return name.strip().strip("`")
+
+def _suggest(name, candidates):
+    matches = difflib.get_close_matches(name, candidates, n=1)
+    return f", did you mean {matches[0]}?" if matches else ""
+
+def _labels(node_match):
+    return [_name(label) for label in re.split(r"\s*:\s*", node_match.group("labels") or "") if label.strip()]
+
+def mask_literals(cypher_statement):
+    """
+    The statement with comments removed and every string literal replaced by a
+    $__literal_<i> placeholder, and the literal values in order.
+    """
+    literals = []
+
+    def placeholder(match):
+        literals.append(match.group(0)[1:-1])
+        return f"$__literal_{len(literals) - 1}"
+
+    masked = LITERAL.sub(placeholder, cypher_statement)
+    return COMMENT.sub("", masked), literals
+
+def variable_bindings(masked):
+    """
+    Maps the variables of node and relationship patterns to the labels and
+    relationship types they are bound to anywhere in the statement.
+    """
+    node_labels, relationship_types = {}, {}
+
+    for match in NODE_PATTERN.finditer(masked):
+        if match.group("variable"):
+          node_labels.setdefault(_name(match.group("variable")), set()).update(_labels(match))
+
+    for match in RELATIONSHIP_PATTERN.finditer(masked):
+        types = [_name(name) for name in re.split(r"\s*\|\s*:?\s*", match.group("types") or "") if name.strip()]
+        if match.group("variable"):
+          relationship_types.setdefault(_name(match.group("variable")), set()).update(types)
+
+    return node_labels, relationship_types
+
+def check_cypher_schema(cypher_statement, structured_schema):
+    """
+    Returns errors for node labels, relationship types and properties that
+    are not in the schema, worded like the LLM reviewer's.
+    """
+    node_props = {
+        label: {prop["property"] for prop in props}
+        for label, props in structured_schema.get("node_props", {}).items()
+    }
+    rel_props = {
+        rel_type: {prop["property"] for prop in props}
+        for rel_type, props in structured_schema.get("rel_props", {}).items()
+    }
+    rel_types = {rel["type"] for rel in structured_schema.get("relationships", [])} | set(rel_props)
+
+    masked, _ = mask_literals(cypher_statement)
+    node_labels, relationship_types = variable_bindings(masked)
+    errors = []
+
+    def report(error):
+        if error not in errors:
+          errors.append(error)
+
+    def check_properties(variable, properties):
+        if variable in node_labels and node_labels[variable] and node_labels[variable] <= set(node_props):
+          labels, known = node_labels[variable], node_props
+        elif variable in relationship_types and relationship_types[variable] and relationship_types[variable] <= rel_types:
+          labels, known = relationship_types[variable], rel_props
+        else:
+          return
+
+        candidates = set().union(*(known.get(label, set()) for label in labels))
+        for prop in properties:
+            if prop not in candidates:
+              report(f"Property {prop} does not exist for label {'|'.join(sorted(labels))}{_suggest(prop, sorted(candidates))}")
+
+    for match in NODE_PATTERN.finditer(masked):
+        labels = _labels(match)
+        for label in labels:
+            if label not in node_props:
+              suggestion = difflib.get_close_matches(label, sorted(node_props), n=1)
+              report(f"Label (:{label}) does not exist" + (f", did you mean (:{suggestion[0]})?" if suggestion else ""))
+        if match.group("props") and labels and set(labels) <= set(node_props):
+          candidates = set().union(*(node_props[label] for label in labels))
+          for key in MAP_KEY.finditer(match.group("props")):
+              if _name(key.group("key")) not in candidates:
+                report(f"Property {_name(key.group('key'))} does not exist for label {'|'.join(sorted(labels))}{_suggest(_name(key.group('key')), sorted(candidates))}")
+
+    for match in RELATIONSHIP_PATTERN.finditer(masked):
+        for rel_type in re.split(r"\s*\|\s*:?\s*", match.group("types") or ""):
+            if rel_type.strip() and _name(rel_type) not in rel_types:
+              report(f"Relationship {_name(rel_type)} does not exist{_suggest(_name(rel_type), sorted(rel_types))}")
+
+    accessed = {}
+    for match in PROPERTY_ACCESS.finditer(masked):
+        accessed.setdefault(_name(match.group("variable")), []).append(_name(match.group("property")))
+    for match in MAP_PROJECTION.finditer(masked):
+        accessed.setdefault(_name(match.group("variable")), []).extend(
+            _name(item.group("property")) for item in PROJECTED_PROPERTY.finditer(match.group("items"))
+        )
+
+    for variable, properties in accessed.items():
+        check_properties(variable, properties)
+
+    return errors
+
+def literal_filters(cypher_statement):
+    """
+    (label, property, value) for each string-literal equality on a labelled
+    variable (`f.type = 'veg'`, `toLower(r.name) = toLower('kfc')`) or in an
+    inline property map, for the value-mapping check.
+    """
+    masked, literals = mask_literals(cypher_statement)
+    node_labels, _ = variable_bindings(masked)
+    filters = []
+
+    for match in EQUALITY_FILTER.finditer(masked):
+        for label in sorted(node_labels.get(_name(match.group("variable")), ())):
+            filters.append((label, _name(match.group("property")), literals[int(match.group("literal"))]))
+
+    for match in NODE_PATTERN.finditer(masked):
+        labels = _labels(match)
+        for key in INLINE_FILTER.finditer(match.group("props") or ""):
+            for label in labels:
+                filters.append((label, _name(key.group("key")), literals[int(key.group("literal"))]))
+
+    return list(dict.fromkeys(filters))
@@ -0,0 +1,55 @@
+import numpy as np
+from langchain_core.example_selectors import BaseExampleSelector
+
+
+class NumpyExampleSelector(BaseExampleSelector):
+    """
+    Selects the k examples most similar to the input by exact cosine similarity
+    over an in-memory matrix of example embeddings.
+
+    The few-shot files hold a few dozen examples, so a matrix-vector product is
+    cheaper than a round trip to a vector index, and the examples never have to
+    be written anywhere. Pass `vectors` (e.g. from the snapshot) to skip
+    embedding the examples.
+    """
+
+    def __init__(self, examples, embeddings, k=4, input_keys=None, vectors=None):
+        self.examples = list(examples)
+        self.embeddings = embeddings
+        self.k = k
+        self.input_keys = input_keys
+
+        if vectors is None:
+          vectors = embeddings.embed_documents([self._example_text(example) for example in self.examples])
+        self.matrix = self._normalize(np.asarray(vectors, dtype=np.float32).reshape(len(self.examples), -1))
+
+    @staticmethod
+    def _normalize(matrix):
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+    def _example_text(self, example):
+        keys = self.input_keys or sorted(example)
+        return " ".join(str(example[key]) for key in keys)
+
+    def _top_k(self, vector):
+        if not self.examples:
+          return []
+
+        similarities = self.matrix @ self._normalize(np.asarray(vector, dtype=np.float32))
+        k = min(self.k, len(self.examples))
+        top = np.argpartition(-similarities, k - 1)[:k]
+        # Most similar first, ties in file order
+        top = top[np.lexsort((top, -similarities[top]))]
+        return [self.examples[i] for i in top]
+
+    def select_examples(self, input_variables):
+        return self._top_k(self.embeddings.embed_query(self._example_text(input_variables)))
+
+    async def aselect_examples(self, input_variables):
+        return self._top_k(await self.embeddings.aembed_query(self._example_text(input_variables)))
+
+    def add_example(self, example):
+        vector = self.embeddings.embed_documents([self._example_text(example)])
+        self.examples.append(example)
+        self.matrix = np.vstack([self.matrix, self._normalize(np.asarray(vector, dtype=np.float32))])
@@ -1,10 +1,15 @@
 import os
 import json
+import asyncio
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
-from langchain_core.example_selectors import SemanticSimilarityExampleSelector
-from langchain_neo4j import Neo4jVector
-from .. import embedding_model, llm, graph_schema, OverallState
+import numpy as np
+from .. import get_embedding_model, get_llm, get_graph_schema, OverallState, lazy_resource, EMBEDDING_MODEL
+from ..snapshot import snapshot_entry, snapshot_path
+from .example_selector import NumpyExampleSelector
+from ..graph_migrations import migrated_properties, use_lowercase_properties
+from .cypher_cache import get_cached_cypher
+from ..singleflight import ainvoke_coalesced
 
 
 CURRENT_DIR = os.path.dirname(__file__)
@@ -13,13 +18,24 @@ file_path = os.path.join(CURRENT_DIR, 'fewshot_examples_cypher_queries.json')
 with open(file_path, 'r') as f:
     examples = json.load(f)
 
-example_selector = SemanticSimilarityExampleSelector.from_examples(
-    examples,
-    embedding_model,
-    Neo4jVector,
-    k=5,
-    input_keys=["question"]
-)
+EXAMPLE_EMBEDDINGS_FILE = "cypher_examples.npy"
+
+@lazy_resource
+def get_example_selector():
+    # The examples are ranked in memory; their embeddings come from the
+    # snapshot when it was built from the same file, else from the embedding cache
+    vectors = None
+    snapshot = snapshot_entry("cypher_examples", source_file=file_path)
+    if snapshot and snapshot.get("model") == EMBEDDING_MODEL:
+      vectors = np.load(snapshot_path(snapshot["embeddings"]))
+
+    return NumpyExampleSelector(
+        examples,
+        get_embedding_model(),
+        k=5,
+        input_keys=["question"],
+        vectors=vectors,
+    )
 
 text2cypher_prompt = ChatPromptTemplate.from_messages(
     [
@@ -41,7 +57,7 @@ FOLLOWING TWO POINTS ARE VERY IMPORTANT:
 
 2. If the question demand food listing then always ensure that the cypher query must always return retaurant, zomato_page, food_name, bestseller, price, food_type, food_rating, description, food_image_url as present in the examples.
 
-3. If you require to use WHERE clause for restaurant name i.e., r.name in cypher query, then always use like this way: toLower(r.name) CONTAINS <name_in_lowercase> OR NOT toLower(r.name) CONTAINS <name_in_lowercase>
+3. {restaurant_name_rule}
 
 Here is the schema information
 {schema}
@@ -57,29 +73,51 @@ Cypher query:"""
     ]
 )
 
-text2cypher_chain = text2cypher_prompt | llm | StrOutputParser()
+RESTAURANT_NAME_RULE = "If you require to use WHERE clause for restaurant name i.e., r.name in cypher query, then always use like this way: toLower(r.name) CONTAINS <name_in_lowercase> OR NOT toLower(r.name) CONTAINS <name_in_lowercase>"
+
+# Once graph_migrations has added the lowercased properties, which are text indexed
+LOWERCASE_RESTAURANT_NAME_RULE = "If you require to use WHERE clause for restaurant name or address in cypher query, then always use the lowercased properties like this way: r.name_lower CONTAINS <name_in_lowercase> OR NOT r.name_lower CONTAINS <name_in_lowercase>, r.address_lower CONTAINS <address_in_lowercase>"
+
+@lazy_resource
+def get_text2cypher_chain():
+    return text2cypher_prompt | get_llm() | StrOutputParser()
 
 async def generate_cypher(state: OverallState) -> OverallState:
     """
     Generates a cypher statement based on the provided schema and user input
     """
 
+    # A statement validated for the same question is executed as is
+    cached_cypher = await get_cached_cypher(state.get("question"))
+    if cached_cypher is not None:
+      return {"cypher_statement": cached_cypher, "next_action": "execute_cypher", "steps": ["generate_cypher", "cypher_cache"]}
+
+    example_selector = await asyncio.to_thread(get_example_selector)
+    migrated = await asyncio.to_thread(migrated_properties)
+    lowercase_names = ("Restaurant", "name_lower") in migrated
+
     NL = '\n'
     fewshot_examples = (NL*2).join(
         [
-            f"Question: {el['question']}{NL}Cypher:{el['query']}"
-            for el in example_selector.select_examples(
+            f"Question: {el['question']}{NL}Cypher:{use_lowercase_properties(el['query'], migrated)}"
+            for el in await example_selector.aselect_examples(
                 {"question": state.get("question")}
             )
         ]
     )
 
-    generated_cypher = await text2cypher_chain.ainvoke(
+    generated_cypher = await ainvoke_coalesced(
+        get_text2cypher_chain(),
         {
             "question": state.get("question"),
             "fewshot_examples": fewshot_examples,
-            "schema": graph_schema,
-        }
+            "schema": get_graph_schema(),
+            "restaurant_name_rule": LOWERCASE_RESTAURANT_NAME_RULE if lowercase_names else RESTAURANT_NAME_RULE,
+        },
+        priority="generate_cypher",
     )
 
-    return {"cypher_statement": generated_cypher, "steps": ["generate_cypher"]}
\ No newline at end of file
+    # The model may still lowercase at query time out of habit
+    generated_cypher = use_lowercase_properties(generated_cypher, migrated)
+
+    return {"cypher_statement": generated_cypher, "next_action": "validate_cypher", "steps": ["generate_cypher"]}
\ No newline at end of file
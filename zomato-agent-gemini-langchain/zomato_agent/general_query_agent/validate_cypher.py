@@ -1,9 +1,18 @@
-from .. import OverallState, safe_query, graph_schema, graph_structured_schema, llm
-from neo4j.exceptions import CypherSyntaxError
+import os
+import json
+import time
+import asyncio
+from .. import OverallState, safe_query, get_graph_schema, get_graph_structured_schema, get_llm, lazy_resource
+from ..stats import FastPathStats
+from .cypher_schema_check import check_cypher_schema, literal_filters
+from .cypher_cache import set_cached_cypher
+from .execute_cypher import NO_RESULT
+from ..tracing import metrics
+from ..singleflight import ainvoke_coalesced
+from langchain_core.callbacks import get_usage_metadata_callback
 from typing import List, Optional
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
-from langchain_neo4j.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
 
 
 validate_cypher_system = """
@@ -78,17 +87,109 @@ class ValidateCypherOutput(BaseModel):
         description="A list of property-based filters applied in the Cypher statement."
     )
 
-validate_cypher_chain = validate_cypher_prompt | llm.with_structured_output(
-    ValidateCypherOutput
-)
+@lazy_resource
+def get_validate_cypher_chain():
+    return validate_cypher_prompt | get_llm().with_structured_output(
+        ValidateCypherOutput
+    )
 
 # Cypher query corrector is experimental
-corrector_schema = [
-    Schema(el["start"], el["type"], el["end"])
-    for el in graph_structured_schema.get("relationships")
-]
+@lazy_resource
+def get_cypher_query_corrector():
+    # deferred, importing langchain_neo4j is slow
+    from langchain_neo4j.chains.graph_qa.cypher_utils import CypherQueryCorrector, Schema
+
+    corrector_schema = [
+        Schema(el["start"], el["type"], el["end"])
+        for el in get_graph_structured_schema().get("relationships")
+    ]
 
-cypher_query_corrector = CypherQueryCorrector(corrector_schema)
+    return CypherQueryCorrector(corrector_schema)
+
+def string_property_filters(filters):
+    """
+    The filters worth a value-mapping check: those on a STRING
+    property of a label in the schema.
+    """
+    node_props = get_graph_structured_schema()["node_props"]
+
+    return [
+        filter for filter in filters or []
+        if any(
+            prop["property"] == filter.property_key and prop["type"] == "STRING"
+            for prop in node_props.get(filter.node_label, [])
+        )
+    ]
+
+@lazy_resource
+def get_value_mapping_query():
+    """
+    One statement checking every filter's value at once. Labels can't be
+    parameters, so there is an EXISTS branch per schema label; the text only
+    depends on the schema and Neo4j plans it once.
+    """
+    branches = " ".join(
+        f"WHEN {json.dumps(label)} THEN EXISTS {{ MATCH (n:`{label}`) WHERE toLower(n[filter.property]) = toLower(filter.value) }}"
+        for label in sorted(get_graph_structured_schema()["node_props"])
+    )
+
+    return f"UNWIND $filters AS filter RETURN filter.index AS index, CASE filter.label {branches} ELSE false END AS hit"
+
+async def check_value_mappings(filters):
+    """
+    Returns the filters whose value matches no node, with a single round trip.
+    """
+    if not filters:
+      return []
+
+    hits = await safe_query(
+        query=await asyncio.to_thread(get_value_mapping_query),
+        params={"filters": [
+            {"index": index, "label": filter.node_label, "property": filter.property_key, "value": filter.property_value}
+            for index, filter in enumerate(filters)
+        ]},
+    )
+
+    matched = {hit["index"] for hit in hits if hit["hit"]}
+    return [filter for index, filter in enumerate(filters) if index not in matched]
+
+async def explain_errors(cypher_statement):
+    from neo4j.exceptions import CypherSyntaxError
+
+    try:
+      await safe_query(query=f"EXPLAIN {cypher_statement}")
+      return []
+    except CypherSyntaxError as e:
+      return [e.message]
+
+# Ask the LLM reviewer on every pass, not only when the local schema checks
+# pass but EXPLAIN still fails
+CYPHER_SEMANTIC_REVIEW = os.getenv("CYPHER_SEMANTIC_REVIEW", "false").lower() == "true"
+
+# validate -> correct rounds before giving up on a generated statement
+MAX_CYPHER_CORRECTIONS = int(os.getenv("MAX_CYPHER_CORRECTIONS", "3"))
+
+validation_stats = FastPathStats()
+
+async def review_cypher(state):
+    start = time.perf_counter()
+
+    with get_usage_metadata_callback() as usage:
+      llm_output = await ainvoke_coalesced(
+          get_validate_cypher_chain(),
+          {
+              "question": state.get("question"),
+              "cypher": state.get("cypher_statement"),
+              "schema": get_graph_schema(),
+          },
+          priority="validate_cypher",
+      )
+
+    validation_stats.record_llm(
+        time.perf_counter() - start,
+        tokens=sum(metadata.get("total_tokens", 0) for metadata in usage.usage_metadata.values()),
+    )
+    return llm_output
 
 async def validate_cypher(state: OverallState) -> OverallState:
     """
@@ -97,76 +198,76 @@ async def validate_cypher(state: OverallState) -> OverallState:
     errors = []
     mapping_errors = []
 
-    try:
-    #   enhanced_graph.query(f"EXPLAIN {state.get('cypher_statement')}")
-        await safe_query(query=f"EXPLAIN {state.get('cypher_statement')}")
-    except CypherSyntaxError as e:
-      errors.append(e.message)
+    start = time.perf_counter()
+    schema_errors = check_cypher_schema(state.get("cypher_statement"), get_graph_structured_schema())
+    local_seconds = time.perf_counter() - start
+
+    # The EXPLAIN round trip, the relationship direction check and the LLM
+    # review (when it is always on) are independent, so they run concurrently
+    explain_result, corrected_cypher, *llm_output = await asyncio.gather(
+        explain_errors(state.get("cypher_statement")),
+        # Experimental feature for correcting relationship directions
+        asyncio.to_thread(get_cypher_query_corrector(), state.get("cypher_statement")),
+        *([review_cypher(state)] if CYPHER_SEMANTIC_REVIEW else []),
+    )
+
+    errors.extend(schema_errors)
+    errors.extend(explain_result)
 
-    # Experimental feature for correcting relationship directions
-    corrected_cypher = cypher_query_corrector(state.get("cypher_statement"))
     if not corrected_cypher:
       errors.append("The generated Cypher statement doesn't fit the graph schema")
     if not corrected_cypher == state.get("cypher_statement"):
       print("Relationship direction was corrected")
 
-    # Use LLM to find additional potential errors and get the mapping for values
-
-    llm_output = await validate_cypher_chain.ainvoke(
-        {
-            "question": state.get("question"),
-            "cypher": state.get("cypher_statement"),
-            "schema": graph_schema,
-        }
-    )
+    # The schema checks explain their own failures; the LLM is only needed to
+    # explain an EXPLAIN failure they didn't catch
+    if not llm_output and explain_result and not schema_errors:
+      llm_output = [await review_cypher(state)]
 
-    if llm_output.errors:
-      errors.extend(llm_output.errors)
-
-    if llm_output.filters:
-      for filter in llm_output.filters:
-        if (
-            not [
-                prop
-                for prop in graph_structured_schema["node_props"][
-                    filter.node_label
-                ]
-                if prop["property"] == filter.property_key
-            ][0]["type"]
-            == "STRING"
-        ):
-          continue
-
-        # mapping = enhanced_graph.query(
-        #     f"MATCH (n: {filter.node_label}) WHERE toLower(n. `{filter.property_key}`) = toLower($value) RETURN 'yes' LIMIT 1",
-        #     {"value": filter.property_value},
-        # )
-
-        mapping = await safe_query(
-           query=f"MATCH (n: {filter.node_label}) WHERE toLower(n. `{filter.property_key}`) = toLower($value) RETURN 'yes' LIMIT 1",
-           params={"value": filter.property_value},
+    if llm_output:
+      if llm_output[0].errors:
+        errors.extend(llm_output[0].errors)
+      filters = llm_output[0].filters
+    else:
+      start = time.perf_counter()
+      filters = [
+          Property(node_label=label, property_key=key, property_value=value)
+          for label, key, value in literal_filters(state.get("cypher_statement"))
+      ]
+      validation_stats.record_local(local_seconds + time.perf_counter() - start)
+
+    for filter in await check_value_mappings(string_property_filters(filters)):
+        print(
+            f"Missing value mapping for {filter.node_label} on property {filter.property_key} with value {filter.property_value}"
         )
 
-        if not mapping:
-          print(
-              f"Missing value mapping for {filter.node_label} on property {filter.property_key} with value {filter.property_value}"
-          )
+        mapping_errors.append(
+            f"Missing value mapping for {filter.node_label} on property {filter.property_key} with value {filter.property_value}"
+        )
 
-          mapping_errors.append(
-              f"Missing value mapping for {filter.node_label} on property {filter.property_key} with value {filter.property_value}"
-          )
+    steps = ["validate_cypher"]
+    database_records = None
 
+    # Ending here, the user gets the same answer as for an empty result
     if mapping_errors:
       next_action = "end"
+      database_records = NO_RESULT
+    elif errors and state.get("steps", []).count("correct_cypher") >= MAX_CYPHER_CORRECTIONS:
+      next_action = "end"
+      database_records = NO_RESULT
+      steps.append("correction_budget_exhausted")
+      metrics.inc("zomato_cypher_correction_budget_exhausted_total", {}, help="Generated Cypher given up on after MAX_CYPHER_CORRECTIONS corrections.")
     elif errors:
       next_action = "correct_cypher"
     else:
       next_action = "execute_cypher"
+      await set_cached_cypher(state.get("question"), corrected_cypher)
 
 
     return {
         "next_action": next_action,
         "cypher_statement": corrected_cypher,
         "cypher_errors": errors,
-        "steps": ["validate_cypher"],
-    }
\ No newline at end of file
+        "database_records": database_records,
+        "steps": steps,
+    }
@@ -0,0 +1,247 @@
+"""
+Admission control for the Gemini calls.
+
+Every LLM chain call and every query embedding that misses the caches runs
+through a Governor, which:
+
+  - keeps requests and (estimated) tokens per minute under the quota with
+    token buckets,
+  - admits waiting calls by priority class, so a new user's guardrail and
+    entity extraction go ahead of another request's Cypher correction,
+  - bounds the queue and rejects calls with `Overloaded` when it is full or a
+    call has waited too long, which /query turns into a 503,
+  - adapts the number of concurrent calls (AIMD): halved and paused on a 429,
+    grown by one per `limit` successful calls back up to the configured maximum.
+"""
+import os
+import time
+import heapq
+import asyncio
+import itertools
+
+
+# Lower runs first
+PRIORITIES = {
+    "guardrail": 0,
+    "entities": 1,
+    "embedding": 1,
+    "generate_cypher": 2,
+    "validate_cypher": 3,
+    "correct_cypher": 4,
+}
+DEFAULT_PRIORITY = 2
+
+# Requests/tokens per minute of 0 disable that bucket
+LLM_RPM = float(os.getenv("LLM_RPM", "1000"))
+LLM_TPM = float(os.getenv("LLM_TPM", "1000000"))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+EMBEDDING_RPM = float(os.getenv("EMBEDDING_RPM", "3000"))
+EMBEDDING_TPM = float(os.getenv("EMBEDDING_TPM", "1000000"))
+EMBEDDING_MAX_CONCURRENCY = int(os.getenv("EMBEDDING_MAX_CONCURRENCY", "32"))
+
+# Calls allowed to wait per governor, and for how long, before Overloaded
+GOVERNOR_MAX_QUEUE = int(os.getenv("GOVERNOR_MAX_QUEUE", "256"))
+GOVERNOR_QUEUE_TIMEOUT = float(os.getenv("GOVERNOR_QUEUE_TIMEOUT", "30"))
+
+# Times a call that hit the quota is queued again (the Gemini client itself
+# makes a single attempt)
+GOVERNOR_RATE_LIMIT_RETRIES = int(os.getenv("GOVERNOR_RATE_LIMIT_RETRIES", "3"))
+
+# Tokens charged per call on top of the prompt estimate, for the response
+OUTPUT_TOKEN_ALLOWANCE = 256
+
+
+class Overloaded(RuntimeError):
+    """
+    The governor's queue is full or the call waited longer than the queue timeout.
+    """
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units a minute up to a one-minute burst. A bucket with
+    `per_minute` 0 never limits.
+    """
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, amount, now):
+        """
+        Seconds until `amount` units (at most the capacity) are available.
+        """
+        if not self.capacity:
+          return 0.0
+
+        self._refill(now)
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0.0)
+
+    def take(self, amount, now):
+        if self.capacity:
+          self._refill(now)
+          self.level -= min(amount, self.capacity)
+
+
+# Quota pushback as raised by the Gemini client versions we support:
+# google.api_core's, langchain_google_genai's wrapper and langchain_core's base
+RATE_LIMIT_ERRORS = {"ResourceExhausted", "TooManyRequests", "GoogleRateLimitError", "ModelRateLimitError"}
+
+def is_rate_limited(error):
+    """
+    Whether an exception from the Gemini client is quota pushback (HTTP 429 /
+    RESOURCE_EXHAUSTED), by status code or exception type. The client may wrap
+    the original error, so its causes are checked too.
+    """
+    while error is not None:
+        if getattr(error, "code", None) == 429 or getattr(error, "status_code", None) == 429:
+          return True
+        if any(cls.__name__ in RATE_LIMIT_ERRORS for cls in type(error).__mro__):
+          return True
+        error = error.__cause__
+    return False
+
+def estimate_tokens(text, output_tokens=OUTPUT_TOKEN_ALLOWANCE):
+    return len(text) // 4 + output_tokens
+
+
+class Governor:
+    def __init__(self, name, rpm, tpm, max_concurrency, max_queue=GOVERNOR_MAX_QUEUE, queue_timeout=GOVERNOR_QUEUE_TIMEOUT):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+
+        self.limit = float(max_concurrency)
+        self.active = 0
+        self._waiters = []
+        self._sequence = itertools.count()
+        self._paused_until = 0.0
+        self._consecutive_rate_limits = 0
+        self._condition = None
+        self._loop = None
+        self.stats = {"calls": 0, "rejected": 0, "rate_limited": 0, "queued_seconds": 0.0}
+
+    def _get_condition(self):
+        # asyncio primitives belong to one event loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+          self._condition = asyncio.Condition()
+          self._loop = loop
+          self._waiters = []
+          self.active = 0
+        return self._condition
+
+    def _wait_seconds(self, entry, tokens, now):
+        """
+        None when `entry` can't run until something else changes, else the
+        seconds until the buckets and the 429 pause let it run (0: now).
+        """
+        if self._waiters[0] is not entry or self.active >= max(int(self.limit), 1):
+          return None
+        return max(self._paused_until - now, self.requests.delay(1, now), self.tokens.delay(tokens, now), 0.0)
+
+    async def _acquire(self, priority, tokens):
+        condition = self._get_condition()
+
+        async with condition:
+          if len(self._waiters) >= self.max_queue:
+            self.stats["rejected"] += 1
+            raise Overloaded(f"Too many {self.name} calls waiting, try again shortly", retry_after=max(self.queue_timeout / 2, 1))
+
+          start = time.monotonic()
+          entry = (PRIORITIES.get(priority, DEFAULT_PRIORITY), next(self._sequence))
+          heapq.heappush(self._waiters, entry)
+
+          try:
+            while True:
+                now = time.monotonic()
+                wait = self._wait_seconds(entry, tokens, now)
+                if wait == 0:
+                  break
+
+                remaining = start + self.queue_timeout - now
+                if remaining <= 0:
+                  self.stats["rejected"] += 1
+                  raise Overloaded(f"{self.name} call waited {self.queue_timeout:g}s for capacity", retry_after=max(wait or 1, 1))
+
+                try:
+                  await asyncio.wait_for(condition.wait(), min(wait, remaining) if wait is not None else remaining)
+                except asyncio.TimeoutError:
+                  pass
+          except BaseException:
+            self._waiters.remove(entry)
+            heapq.heapify(self._waiters)
+            condition.notify_all()
+            raise
+
+          heapq.heappop(self._waiters)
+          self.requests.take(1, now)
+          self.tokens.take(tokens, now)
+          self.active += 1
+          self.stats["calls"] += 1
+          self.stats["queued_seconds"] += now - start
+          condition.notify_all()
+
+    async def _release(self, rate_limited):
+        condition = self._get_condition()
+
+        async with condition:
+          self.active -= 1
+          if rate_limited:
+            self._consecutive_rate_limits += 1
+            self.stats["rate_limited"] += 1
+            self.limit = max(self.limit / 2, 1.0)
+            self._paused_until = time.monotonic() + min(2 ** self._consecutive_rate_limits, 60)
+          else:
+            self._consecutive_rate_limits = 0
+            self.limit = min(self.limit + 1 / self.limit, float(self.max_concurrency))
+          condition.notify_all()
+
+    async def run(self, priority, call, tokens=0):
+        """
+        Awaits call() once the priority class, the buckets and the concurrency
+        limit allow it. A call that hits the quota gives up its slot and is
+        queued again behind the pause, up to GOVERNOR_RATE_LIMIT_RETRIES times.
+        """
+        for attempt in range(GOVERNOR_RATE_LIMIT_RETRIES + 1):
+            await self._acquire(priority, tokens)
+
+            rate_limited = False
+            try:
+              return await call()
+            except Exception as e:
+              rate_limited = is_rate_limited(e)
+              if not rate_limited or attempt == GOVERNOR_RATE_LIMIT_RETRIES:
+                raise
+            finally:
+              await asyncio.shield(self._release(rate_limited))
+
+    def summary(self):
+        return {
+            **self.stats,
+            "queued_seconds": round(self.stats["queued_seconds"], 3),
+            "waiting": len(self._waiters),
+            "active": self.active,
+            "concurrency_limit": int(self.limit),
+        }
+
+
+llm_governor = Governor("LLM", LLM_RPM, LLM_TPM, LLM_MAX_CONCURRENCY)
+embedding_governor = Governor("embedding", EMBEDDING_RPM, EMBEDDING_TPM, EMBEDDING_MAX_CONCURRENCY)
+
+def summary():
+    return {"llm": llm_governor.summary(), "embedding": embedding_governor.summary()}
@@ -0,0 +1,138 @@
+"""
+Graph migrations that add query-friendly copies of imported properties.
+
+The imported ratings are strings that may hold 'not_available', so filtering
+on them needs a per-row toFloatOrNull() and can't use an index. The
+migrations backfill numeric copies (null when unavailable) and create range
+indexes on them and on Food.price, so the parameter-based agent's rating and
+price filters become index seeks. Restaurant names and addresses get
+lowercased copies with text indexes, so case-insensitive CONTAINS matches
+don't have to lowercase every Restaurant node.
+
+Safe to re-run; run it again after every ingest:
+
+    python -m zomato_agent.graph_migrations
+
+Then rebuild the snapshot (`python -m zomato_agent.snapshot`) if you use one,
+so the recorded schema includes the new properties.
+"""
+import os
+import re
+import asyncio
+from . import safe_query, close_driver, lazy_resource, get_graph_structured_schema
+
+
+# (description, statement), run in order
+MIGRATIONS = [
+    (
+        "Restaurant.delivery_rating_num",
+        '''
+        MATCH (r:Restaurant)
+        CALL { WITH r SET r.delivery_rating_num = toFloatOrNull(r.delivery_rating) } IN TRANSACTIONS OF 10000 ROWS
+        ''',
+    ),
+    (
+        "Food.rating_num",
+        '''
+        MATCH (f:Food)
+        CALL { WITH f SET f.rating_num = toFloatOrNull(f.rating) } IN TRANSACTIONS OF 10000 ROWS
+        ''',
+    ),
+    (
+        "Restaurant.name_lower and Restaurant.address_lower",
+        '''
+        MATCH (r:Restaurant)
+        CALL { WITH r SET r.name_lower = toLower(r.name), r.address_lower = toLower(r.address) } IN TRANSACTIONS OF 10000 ROWS
+        ''',
+    ),
+    (
+        "range index on Restaurant.delivery_rating_num",
+        "CREATE RANGE INDEX restaurant_delivery_rating_num IF NOT EXISTS FOR (r:Restaurant) ON (r.delivery_rating_num)",
+    ),
+    (
+        "range index on Food.rating_num",
+        "CREATE RANGE INDEX food_rating_num IF NOT EXISTS FOR (f:Food) ON (f.rating_num)",
+    ),
+    (
+        "range index on Food.price",
+        "CREATE RANGE INDEX food_price IF NOT EXISTS FOR (f:Food) ON (f.price)",
+    ),
+    (
+        "text index on Restaurant.name_lower",
+        "CREATE TEXT INDEX restaurant_name_lower IF NOT EXISTS FOR (r:Restaurant) ON (r.name_lower)",
+    ),
+    (
+        "text index on Restaurant.address_lower",
+        "CREATE TEXT INDEX restaurant_address_lower IF NOT EXISTS FOR (r:Restaurant) ON (r.address_lower)",
+    ),
+]
+
+# (label, property) pairs the migrations add
+MIGRATED_PROPERTY_NAMES = [
+    ("Restaurant", "delivery_rating_num"),
+    ("Food", "rating_num"),
+    ("Restaurant", "name_lower"),
+    ("Restaurant", "address_lower"),
+]
+
+# "auto" uses the migrated properties the graph schema shows; "true"/"false"
+# assume all or none of them
+MIGRATED_PROPERTIES = os.getenv("MIGRATED_PROPERTIES", "auto").lower()
+
+@lazy_resource
+def migrated_properties():
+    """
+    The (label, property) pairs from MIGRATED_PROPERTY_NAMES that queries can use.
+    """
+    if MIGRATED_PROPERTIES != "auto":
+      return frozenset(MIGRATED_PROPERTY_NAMES) if MIGRATED_PROPERTIES == "true" else frozenset()
+
+    node_props = get_graph_structured_schema().get("node_props", {})
+    return frozenset(
+        (label, prop) for label, prop in MIGRATED_PROPERTY_NAMES
+        if any(item["property"] == prop for item in node_props.get(label, []))
+    )
+
+def use_lowercase_properties(cypher_query, migrated):
+    """
+    Rewrites toLower(<r>.name) and toLower(<r>.address) on Restaurant variables
+    of a generated statement to the pre-lowercased properties, so the text
+    indexes can serve the match.
+    """
+    restaurant_variables = set(re.findall(r"\(\s*(\w+)\s*:\s*Restaurant\b", cypher_query))
+
+    for variable in restaurant_variables:
+        for prop in ["name", "address"]:
+            if ("Restaurant", f"{prop}_lower") in migrated:
+              cypher_query = re.sub(rf"toLower\(\s*{variable}\.{prop}\s*\)", f"{variable}.{prop}_lower", cypher_query)
+
+    return cypher_query
+
+COVERAGE_QUERY = '''
+MATCH (r:Restaurant)
+WITH count(r) AS restaurants, count(r.delivery_rating_num) AS rated_restaurants, count(r.name_lower) AS lowercased_restaurants
+MATCH (f:Food)
+RETURN restaurants, rated_restaurants, lowercased_restaurants, count(f) AS foods, count(f.rating_num) AS rated_foods
+'''
+
+async def migrate():
+    for description, statement in MIGRATIONS:
+        await safe_query(query=statement)
+        print(f"Applied: {description}")
+
+    await safe_query(query="CALL db.awaitIndexes(300)")
+
+    coverage = (await safe_query(query=COVERAGE_QUERY))[0]
+    print(f"Numeric delivery ratings on {coverage['rated_restaurants']} of {coverage['restaurants']} restaurants, "
+          f"numeric ratings on {coverage['rated_foods']} of {coverage['foods']} foods, "
+          f"lowercased names on {coverage['lowercased_restaurants']} restaurants")
+
+async def main():
+    try:
+      await migrate()
+    finally:
+      await close_driver()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
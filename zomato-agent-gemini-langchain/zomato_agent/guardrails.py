@@ -1,7 +1,16 @@
+import os
+import re
+import time
+import asyncio
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field
 from typing import Literal
-from . import llm, OverallState, InputState
+from . import get_llm, OverallState, InputState, lazy_resource
+from .snapshot import snapshot_entry
+from .stats import FastPathStats
+from .singleflight import ainvoke_coalesced
+from .parameter_based_agent.entities import examples_for_entity_extraction
+from .parameter_based_agent.generate_database_records import extract_entities_speculatively
 
 
 guardrails_system = """
@@ -33,21 +42,161 @@ class GuardrailsOutput(BaseModel):
       description="Decision on whether the question is related to foods or restaurant or anything else"
   )
 
-guardrails_chain = guardrails_prompt | llm.with_structured_output(GuardrailsOutput)
+@lazy_resource
+def get_guardrails_chain():
+    return guardrails_prompt | get_llm().with_structured_output(GuardrailsOutput)
 
-def guardrails(state: InputState) -> OverallState:
+# First stage: settle clear-cut questions with a local lexicon match and only
+# send the ambiguous ones to the LLM
+GUARDRAILS_FAST_PATH = os.getenv("GUARDRAILS_FAST_PATH", "true").lower() == "true"
+
+# Dish, ingredient and cuisine names: one of these settles "food" locally
+FOOD_WORDS = {
+    "veg", "nonveg", "vegetarian", "vegan", "bestseller", "bestselling", "pizza", "burger", "burgers",
+    "sandwich", "pasta", "noodles", "fries", "taco", "tacos", "burrito", "sushi", "momos", "momo", "biryani",
+    "pulao", "roti", "naan", "paratha", "kulcha", "dal", "paneer", "chicken", "mutton", "prawn", "prawns",
+    "kebab", "tikka", "tandoori", "curry", "masala", "korma", "kadai", "dosa", "idli", "vada", "uttapam",
+    "sambar", "thali", "chole", "bhature", "samosa", "pakora", "chaat", "golgappa", "pav", "bhaji", "khichdi",
+    "raita", "manchurian", "chowmein", "shawarma", "falafel", "hummus", "lassi", "chai", "coffee", "mocha",
+    "latte", "cappuccino", "smoothie", "mojito", "brownie", "icecream", "kulfi", "gulab", "jamun", "rasgulla",
+    "jalebi", "halwa", "kheer", "ladoo", "barfi", "waffle", "pancake", "donut", "cuisine", "italian",
+    "chinese", "mughlai", "continental", "mexican", "thai", "turkish", "tibetan",
+}
+
+# Food-ish words that are just as common elsewhere ("order a passport", "ice
+# cream sandwich theorem"). They never settle a question locally, and are
+# dropped from the vocabulary learned from the examples and the graph.
+GENERIC_WORDS = {
+    "food", "foods", "dish", "dishes", "meal", "meals", "menu", "order", "orders", "eat", "eating", "hungry",
+    "snack", "breakfast", "lunch", "dinner", "dessert", "desserts", "sweet", "sweets", "drink", "drinks",
+    "beverage", "egg", "eggs", "spicy", "cheesy", "crispy", "hot", "cold", "fresh", "rice", "fish", "salad",
+    "soup", "wrap", "roll", "rolls", "shake", "shakes", "juice", "tea", "cake", "cakes", "pastry", "cookie",
+    "cookies", "ice", "cream", "chocolate", "bakery", "cheese", "sauce", "bowl", "bucket", "platter", "bread",
+    "mix", "mini", "double", "royal", "punch", "delight", "treat", "delivery", "deliver", "delivers",
+    "dining", "dine", "takeaway", "outlet", "outlets", "subway",
+}
+
+# Restaurant words and chains: settle "restaurant" locally
+RESTAURANT_WORDS = {
+    "restaurant", "restaurants", "cafe", "cafes", "dhaba", "eatery", "zomato", "kfc", "mcdonald", "mcdonalds",
+    "dominos", "haldiram", "haldirams",
+}
+
+# Any of these sends the question to the LLM, whatever else it mentions: "any
+# discount code at Barbeque Nation?" is still a restaurant question
+OFF_TOPIC_WORDS = {
+    "weather", "temperature", "politics", "election", "president", "minister", "government", "python",
+    "javascript", "java", "code", "coding", "program", "programming", "bug", "stock", "stocks", "crypto",
+    "bitcoin", "movie", "movies", "song", "songs", "lyrics", "football", "cricket", "math", "equation",
+    "theorem", "proof", "translate", "poem", "essay", "joke", "jokes", "news", "homework", "physics",
+    "chemistry", "history", "geography", "capital", "country", "population", "flight", "flights", "hotel",
+    "hotels", "visa", "passport",
+}
+
+# Common words that show up in Food names but say nothing about the topic
+STOP_WORDS = {
+    "and", "with", "the", "for", "from", "of", "in", "on", "or", "any", "all", "new", "free", "add", "extra",
+    "combo", "special", "large", "small", "medium", "regular", "half", "full", "plate", "pack", "pcs",
+    "piece", "pieces", "box", "house", "style", "classic", "king", "best", "what", "you", "can",
+}
+
+def _learned_words(words):
+    # Words from names are only trusted when they are long enough to be specific
+    return {word for word in words if len(word) > 3}
+
+def _example_food_words():
+    words = set()
+    for example in examples_for_entity_extraction:
+        for food_name in re.findall(r'"food_name":\s*"([^"]*)"', example["order_info"]):
+            words.update(re.findall(r"[a-z]+", food_name.lower()))
+    return _learned_words(words)
+
+@lazy_resource
+def get_food_vocabulary():
+    # Tokens that recur across many Food names in the graph, if the snapshot
+    # has them, on top of the built-in lexicon and the extraction examples
+    snapshot = snapshot_entry("food_vocabulary")
+    graph_words = _learned_words(snapshot["words"]) if snapshot else set()
+    return (FOOD_WORDS | _example_food_words() | graph_words) - GENERIC_WORDS - RESTAURANT_WORDS - OFF_TOPIC_WORDS - STOP_WORDS
+
+def _tokens(question):
+    tokens = set(re.findall(r"[a-z]+", (question or "").lower()))
+    # crude singulars so "burritos"/"dishes" match "burrito"/"dish"
+    tokens |= {token[:-2] for token in tokens if token.endswith("es")}
+    tokens |= {token[:-1] for token in tokens if token.endswith("s")}
+    return tokens
+
+def classify_locally(question):
+    """
+    Returns "food" or "restaurant" when the question names a dish, cuisine or
+    restaurant and nothing off-topic, or None when it has to go to the LLM.
+    Nothing is refused locally: questions that only hit generic or off-topic
+    words are left to the LLM.
+    """
+    tokens = _tokens(question)
+
+    if tokens & OFF_TOPIC_WORDS:
+      return None
+    if tokens & get_food_vocabulary():
+      return "food"
+    if tokens & RESTAURANT_WORDS:
+      return "restaurant"
+    return None
+
+# When the guardrail needs the LLM, start entity extraction at the same time
+# and discard it if the question turns out to be off-topic
+SPECULATIVE_EXECUTION = os.getenv("SPECULATIVE_EXECUTION", "true").lower() == "true"
+
+guardrails_stats = FastPathStats()
+
+def _discard(task):
+    task.cancel()
+    if task.done() and not task.cancelled():
+      task.exception() # retrieve it so asyncio doesn't log it as unhandled
+
+async def guardrails(state: InputState) -> OverallState:
     """
     Decides if the question is related to foods or restaurant or not.
     """
 
-    guardrails_output = guardrails_chain.invoke({"question": state.get("question")})
+    start = time.perf_counter()
+    decision = classify_locally(state.get("question")) if GUARDRAILS_FAST_PATH else None
+    entities = None
+    steps = ["guardrail"]
+
+    if decision:
+      guardrails_stats.record_local(time.perf_counter() - start)
+    else:
+      entities_task = None
+      if SPECULATIVE_EXECUTION:
+        entities_task = asyncio.create_task(extract_entities_speculatively(state.get("question")))
+
+      try:
+        guardrails_output = await ainvoke_coalesced(get_guardrails_chain(), {"question": state.get("question")}, priority="guardrail")
+      except BaseException:
+        if entities_task:
+          _discard(entities_task)
+        raise
+
+      decision = guardrails_output.decision
+      guardrails_stats.record_llm(time.perf_counter() - start)
+
+      if entities_task:
+        if decision == "end":
+          _discard(entities_task)
+          steps.append("speculative_extraction_discarded")
+        else:
+          entities = await entities_task
+          steps.append("speculative_extraction")
+
     database_records = None
 
-    if guardrails_output.decision == "end":
+    if decision == "end":
       database_records = "This questions is not about food (ordering/detail) or their related. Therefore I cannot answer this question."
 
     return {
-        "next_action": guardrails_output.decision,
+        "next_action": decision,
         "database_records": database_records,
-        "steps": ["guardrail"],
+        "entities": entities,
+        "steps": steps,
     }
\ No newline at end of file
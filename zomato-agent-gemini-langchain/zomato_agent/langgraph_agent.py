@@ -1,6 +1,7 @@
 from langgraph.graph import END, START, StateGraph
 from . import OverallState, InputState, OutputState
 from typing import Literal
+from .tracing import traced, install_token_usage_handler
 from .guardrails import guardrails
 from .parameter_based_agent.generate_database_records import generate_database_records
 from .general_query_agent.generate_cypher import generate_cypher
@@ -25,6 +26,14 @@ def database_record_condition(
   else: # next_action = "generate_final_answer"
     return END
 
+def generate_cypher_condition(
+    state: OverallState
+) -> Literal["validate_cypher", "execute_cypher"]:
+  if state.get("next_action") == "execute_cypher": # cached statement
+    return "execute_cypher"
+  else: # next_action == "validate_cypher"
+    return "validate_cypher"
+
 def validate_cypher_condition(
     state: OverallState
 ) -> Literal["correct_cypher", "execute_cypher", '__end__']:
@@ -37,12 +46,12 @@ def validate_cypher_condition(
 
 
 langgraph = StateGraph(state_schema=OverallState, input=InputState, output=OutputState)
-langgraph.add_node(guardrails)
-langgraph.add_node(generate_database_records)
-langgraph.add_node(generate_cypher)
-langgraph.add_node(validate_cypher)
-langgraph.add_node(correct_cypher)
-langgraph.add_node(execute_cypher)
+langgraph.add_node(traced(guardrails))
+langgraph.add_node(traced(generate_database_records))
+langgraph.add_node(traced(generate_cypher))
+langgraph.add_node(traced(validate_cypher))
+langgraph.add_node(traced(correct_cypher))
+langgraph.add_node(traced(execute_cypher))
 
 
 langgraph.add_edge(START, "guardrails")
@@ -55,7 +64,10 @@ langgraph.add_conditional_edges(
     database_record_condition,
 )
 
-langgraph.add_edge("generate_cypher", "validate_cypher")
+langgraph.add_conditional_edges(
+    "generate_cypher",
+    generate_cypher_condition,
+)
 
 langgraph.add_conditional_edges(
     "validate_cypher",
@@ -66,3 +78,6 @@ langgraph.add_edge("correct_cypher", "validate_cypher")
 langgraph.add_edge("execute_cypher", END)
 
 langgraph = langgraph.compile()
+
+# Token usage is attributed to the node spans from here on
+install_token_usage_handler()
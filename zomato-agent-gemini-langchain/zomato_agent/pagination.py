@@ -0,0 +1,81 @@
+import os
+import json
+import uuid
+import base64
+import binascii
+from .cache import LRUCache
+
+
+# Ranked results are kept server-side for PAGE_STORE_TTL seconds so that the
+# next pages of an answer are served without re-running the pipeline
+PAGE_STORE_SIZE = int(os.getenv("PAGE_STORE_SIZE", "256"))
+PAGE_STORE_TTL = float(os.getenv("PAGE_STORE_TTL", "300"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "200"))
+
+result_pages = LRUCache(maxsize=PAGE_STORE_SIZE, ttl=PAGE_STORE_TTL)
+
+
+class CursorError(ValueError):
+    """
+    The cursor could not be decoded.
+    """
+
+
+class CursorExpired(CursorError):
+    """
+    The cursor's result set is no longer in the page store.
+    """
+
+
+def encode_cursor(result_id, offset, page_size):
+    payload = json.dumps({"id": result_id, "offset": offset, "page_size": page_size}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor):
+    try:
+      payload = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+      result_id, offset, page_size = payload["id"], int(payload["offset"]), int(payload["page_size"])
+    except (binascii.Error, ValueError, KeyError, TypeError) as e:
+      raise CursorError("Malformed cursor") from e
+
+    if offset < 0 or page_size <= 0:
+      raise CursorError("Malformed cursor")
+    return result_id, offset, page_size
+
+def page(result, result_id, offset, page_size):
+    """
+    One page of a stored result: the result with `database_records` sliced,
+    plus `total_records` and the `next_cursor` (None on the last page).
+    """
+    records = result["database_records"]
+    next_offset = offset + page_size
+
+    return {
+        **result,
+        "database_records": records[offset:next_offset],
+        "total_records": len(records),
+        "next_cursor": encode_cursor(result_id, next_offset, page_size) if next_offset < len(records) else None,
+    }
+
+def first_page(result, page_size):
+    """
+    Stores a ranked result and returns its first page. Answers that are not a
+    record list (e.g. the guardrail message) are returned whole.
+    """
+    page_size = min(page_size, MAX_PAGE_SIZE)
+    if not isinstance(result.get("database_records"), list):
+      return {**result, "total_records": None, "next_cursor": None}
+
+    result_id = uuid.uuid4().hex
+    if len(result["database_records"]) > page_size:
+      result_pages.set(result_id, result)
+    return page(result, result_id, 0, page_size)
+
+def next_page(cursor, page_size=None):
+    result_id, offset, cursor_page_size = decode_cursor(cursor)
+
+    result = result_pages.get(result_id)
+    if result is None:
+      raise CursorExpired("Cursor expired, run the query again")
+
+    return page(result, result_id, offset, min(page_size or cursor_page_size, MAX_PAGE_SIZE))
@@ -0,0 +1,162 @@
+import heapq
+import numpy as np
+
+
+def to_float(value, default=None):
+  try:
+    return float(value)
+  except (TypeError, ValueError):
+    return default
+
+def numeric_column(values):
+  """
+  float64 column from record values; None and non-numeric values become NaN.
+  """
+  try:
+    return np.array(values, dtype=np.float64)
+  except (TypeError, ValueError):
+    return np.array([to_float(value, np.nan) for value in values], dtype=np.float64)
+
+def tiebreak_column(table, position, params):
+  """
+  Per-candidate tiebreak, lower is better, used to order deals with the same
+  number of dishes and the same average similarity. Mirrors the order filters
+  extracted from the question; by default the deliverables fulltext score
+  decides.
+  """
+  if 'food_price_filter' in params:
+    direction = -1 if params['food_price_filter'] == 'DESC' else 1
+    return direction * table.cost
+
+  for filter_key, rating_key in [('food_rating_filter', 'food_rating'), ('restaurant_rating_filter', 'delivery_rating')]:
+    if filter_key in params:
+      # The rating of the first dish orders the deals; unrated ones go last
+      if position:
+        return np.zeros(len(table.records))
+
+      rating = numeric_column([record.get(rating_key) for record in table.records])
+      if params[filter_key] == 'DESC':
+        return np.where(np.isnan(rating), 0, -rating)
+      return np.where(np.isnan(rating), 1e3, rating)
+
+  return -np.nan_to_num(table.restaurant_score)
+
+
+class CandidateTable:
+  """
+  One dish's candidate records as columns, de-duplicated and sorted by
+  restaurant, then best candidate first (similarity, then tiebreak).
+  """
+
+  def __init__(self, records, position, params, restaurant_codes):
+    unique_records = {}
+    for record in records:
+      # Records of one query share their key order
+      key = tuple(record.items())
+      try:
+        unique_records.setdefault(key, record)
+      except TypeError: # list values
+        unique_records.setdefault(repr(key), record)
+    self.records = list(unique_records.values())
+
+    codes = np.array([
+        restaurant_codes.setdefault(record['restaurant_id'], len(restaurant_codes))
+        for record in self.records
+    ], dtype=np.int64)
+
+    # Hybrid search score, or the deliverables fulltext score for restaurant-only entities
+    self.restaurant_score = numeric_column([record.get('restaurant_score') for record in self.records])
+    similarity = numeric_column([record.get('similarity_score') for record in self.records])
+    self.similarity = np.where(np.isnan(similarity), self.restaurant_score, similarity)
+
+    price = numeric_column([record.get('price') for record in self.records])
+    quantity = np.trunc(numeric_column([record.get('quantity') for record in self.records]))
+    self.cost = np.where(np.isnan(price) | np.isnan(quantity), 0, price * quantity)
+
+    tiebreak = tiebreak_column(self, position, params)
+    order = np.lexsort((tiebreak, -np.nan_to_num(self.similarity), codes))
+
+    self.records = [self.records[i] for i in order]
+    self.restaurant_score = self.restaurant_score[order]
+    self.similarity = self.similarity[order]
+    self.ranking_similarity = np.nan_to_num(self.similarity)
+    self.cost = self.cost[order]
+    self.tiebreak = tiebreak[order]
+    self.restaurants, self.starts, self.counts = np.unique(codes[order], return_index=True, return_counts=True)
+
+
+def mean_similarity_key(similarity_sum, dish_count):
+  # Rounded so that float noise from summing in a different order does not
+  # override the tiebreak between deals with the same average similarity
+  return round(-similarity_sum / dish_count, 9)
+
+def top_k_deals(results, params, k):
+  """
+  Picks up to k deals, best first, without materialising every combination.
+
+  `results` holds one record list per dish. A deal is one restaurant with one
+  candidate for each dish found there, and deals rank by number of dishes,
+  then average similarity, then the tiebreak from the order filters.
+
+  Every key component is a sum over the chosen candidates, so with each
+  restaurant's candidates sorted best first, moving one dish to a later
+  candidate never improves a deal. The heap therefore starts from every
+  restaurant's best deal, and each popped deal only pushes its direct
+  successors. Successors are generated by advancing dish positions in
+  non-decreasing order, so each combination is reached exactly once.
+
+  Returns the candidate tables and a (deals x dishes) matrix of the chosen
+  row in each table, -1 where the dish is not part of the deal.
+  """
+  restaurant_codes = {}
+  tables = [
+      CandidateTable(records, position, params, restaurant_codes)
+      for position, records in enumerate(results)
+  ]
+
+  # Where each restaurant's candidates start and how many there are, per dish
+  starts = np.full((len(tables), len(restaurant_codes)), -1, dtype=np.int64)
+  counts = np.zeros((len(tables), len(restaurant_codes)), dtype=np.int64)
+  for position, table in enumerate(tables):
+    starts[position, table.restaurants] = table.starts
+    counts[position, table.restaurants] = table.counts
+
+  # Every restaurant's best deal, computed for all restaurants at once
+  present = starts >= 0
+  dish_count = present.sum(axis=0)
+  similarity_sum = np.zeros(len(restaurant_codes))
+  tiebreak_sum = np.zeros(len(restaurant_codes))
+  for position, table in enumerate(tables):
+    best = np.where(present[position], starts[position], 0)
+    similarity_sum += np.where(present[position], table.ranking_similarity[best], 0)
+    tiebreak_sum += np.where(present[position], table.tiebreak[best], 0)
+
+  heap = [
+      (-count, mean_similarity_key(similarity, count), tiebreak, restaurant, (0,) * count, 0, similarity)
+      for restaurant, (count, similarity, tiebreak) in enumerate(zip(dish_count.tolist(), similarity_sum.tolist(), tiebreak_sum.tolist()))
+  ]
+  heapq.heapify(heap)
+
+  chosen_rows = []
+  while heap and len(chosen_rows) < k:
+    negative_count, _, tiebreak, restaurant, offsets, first_position, similarity = heapq.heappop(heap)
+    dishes = np.flatnonzero(present[:, restaurant]).tolist()
+
+    rows = [-1] * len(tables)
+    for dish, offset in zip(dishes, offsets):
+      rows[dish] = int(starts[dish, restaurant]) + offset
+    chosen_rows.append(rows)
+
+    for position in range(first_position, len(dishes)):
+      dish = dishes[position]
+      if offsets[position] + 1 < counts[dish, restaurant]:
+        table, row = tables[dish], rows[dish]
+        successor_similarity = similarity + table.ranking_similarity[row + 1] - table.ranking_similarity[row]
+        successor_tiebreak = tiebreak + table.tiebreak[row + 1] - table.tiebreak[row]
+        successor = offsets[:position] + (offsets[position] + 1,) + offsets[position + 1:]
+        heapq.heappush(heap, (
+            negative_count, mean_similarity_key(successor_similarity, -negative_count), float(successor_tiebreak),
+            restaurant, successor, position, float(successor_similarity),
+        ))
+
+  return tables, np.array(chosen_rows, dtype=np.int64).reshape(len(chosen_rows), len(tables))
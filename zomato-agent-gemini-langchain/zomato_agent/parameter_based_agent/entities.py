@@ -1,12 +1,13 @@
 from langchain_core.prompts import ChatPromptTemplate
 from pydantic import BaseModel, Field, field_validator
 from typing import List, Literal, Union, Optional
-from .. import llm, embedding_model
+from .. import get_llm, get_embedding_model, lazy_resource
+from ..snapshot import snapshot_entry, snapshot_path
+from ..singleflight import ainvoke_coalesced
 from langchain_core.example_selectors import SemanticSimilarityExampleSelector
-from langchain_community.vectorstores import FAISS
-from langchain.docstore.document import Document
 import os
 import json
+import asyncio
 
 CURRENT_DIR = os.path.dirname(__file__)
 file_path = os.path.join(CURRENT_DIR, 'examples_for_entity_extraction.json')
@@ -14,23 +15,38 @@ file_path = os.path.join(CURRENT_DIR, 'examples_for_entity_extraction.json')
 with open(file_path, 'r') as f:
     examples_for_entity_extraction = json.load(f)
 
-documents = [
-    Document(page_content=ex["question"], metadata={"order_info": ex["order_info"]})
-    for ex in examples_for_entity_extraction
-]
-
-vectorstore = FAISS.from_documents(
-    documents=documents,
-    embedding=embedding_model
-)
+def build_entity_examples_vectorstore():
+    """
+    Embeds every example question into a FAISS index, keeping the example itself
+    as metadata so the selector can return it.
+    """
+    from langchain_community.vectorstores import FAISS # deferred, slow to import
+
+    return FAISS.from_texts(
+        texts=[ex["question"] for ex in examples_for_entity_extraction],
+        embedding=get_embedding_model(),
+        metadatas=examples_for_entity_extraction,
+    )
 
-entity_example_selector = SemanticSimilarityExampleSelector.from_examples(
-    examples=examples_for_entity_extraction,
-    embeddings = embedding_model,
-    vectorstore_cls=vectorstore,
-    k=5,
-    input_keys=["question"],
-)
+@lazy_resource
+def get_entity_example_selector():
+    snapshot = snapshot_entry("entity_examples", source_file=file_path)
+    if snapshot:
+      from langchain_community.vectorstores import FAISS
+
+      vectorstore = FAISS.load_local(
+          snapshot_path(snapshot["index"]),
+          get_embedding_model(),
+          allow_dangerous_deserialization=True, # written by zomato_agent.snapshot
+      )
+    else:
+      vectorstore = build_entity_examples_vectorstore()
+
+    return SemanticSimilarityExampleSelector(
+        vectorstore=vectorstore,
+        k=5,
+        input_keys=["question"],
+    )
 
 class RestaurantNamePair(BaseModel):
   restaurant_name: str
@@ -228,9 +244,13 @@ entity_prompt = ChatPromptTemplate.from_messages(
     ]
 )
 
-entity_chain = entity_prompt | llm.with_structured_output(Entities)
+@lazy_resource
+def get_entity_chain():
+    return entity_prompt | get_llm().with_structured_output(Entities)
 
 async def get_entities(question):
+    entity_example_selector = await asyncio.to_thread(get_entity_example_selector)
+
     NL = '\n'
     fewshot_examples = (NL*2).join(
         [
@@ -241,5 +261,5 @@ async def get_entities(question):
         ]
     )
 
-    extracted_entities = await entity_chain.ainvoke({"question": question, "examples": fewshot_examples})
+    extracted_entities = await ainvoke_coalesced(get_entity_chain(), {"question": question, "examples": fewshot_examples}, priority="entities")
     return extracted_entities
\ No newline at end of file
@@ -1,18 +1,48 @@
-import pandas as pd
+import os
 from .entities import get_entities
 from .hybrid_search import get_food_scores
-from .. import safe_query
+from .. import safe_query, get_embedding_model, emit_progress
 from .search_query_params import get_search_query_and_params
-from .prepare_db_records import prepare_db_records
-from .generate_parameter_based_cypher import build_cypher_query
+from .prepare_db_records import prepare_db_records, DEFAULT_DEAL_LIMIT
+from .generate_parameter_based_cypher import build_cypher_query, compile_batched_query, top_k_cypher
 import asyncio
 
-async def process_entity(entity, tolerance, passing_threshold, index):
+TOLERANCE = 10
+
+# Run all entity queries of an order as one statement (one round trip) instead
+# of one query per entity
+BATCHED_ENTITY_QUERIES = os.getenv("BATCHED_ENTITY_QUERIES", "true").lower() == "true"
+
+# Warm the query-embedding cache with each entity's search query as soon as the
+# speculative entity extraction returns
+SPECULATIVE_QUERY_EMBEDDING = os.getenv("SPECULATIVE_QUERY_EMBEDDING", "true").lower() == "true"
+
+async def extract_entities_speculatively(question):
+    """
+    Entity extraction started alongside the guardrail. Also prefetches the
+    query embeddings hybrid search will need, so they are cache hits later.
+    """
+    entities = await get_entities(question=question)
+
+    if SPECULATIVE_QUERY_EMBEDDING:
+      search_queries = [
+          (await get_search_query_and_params(entity, TOLERANCE))[0]
+          for entity in entities.order_info
+      ]
+      await asyncio.gather(*[
+          get_embedding_model().aembed_query(search_query)
+          for search_query in set(search_queries) if search_query
+      ], return_exceptions=True) # a failed prefetch just means a cache miss later
+
+    return entities
+
+async def prepare_entity_query(entity, tolerance, passing_threshold, index=0):
     search_query, params = await get_search_query_and_params(entity, tolerance)
 
     food_scores = []
     if search_query:
         food_scores = await get_food_scores(search_query, passing_threshold)
+        emit_progress("search", entity=index, search_query=search_query, food_matches=len(food_scores))
 
     if food_scores:
         params["food_scores"] = food_scores
@@ -20,39 +50,61 @@ async def process_entity(entity, tolerance, passing_threshold, index):
     # Build Cypher query (same as your existing logic)
     cypher_query = await build_cypher_query(entity, search_query, params)
 
-    result = await safe_query(query=cypher_query, params=params)
+    return cypher_query, params
+
+async def execute_entity_queries(entity_queries):
+    """
+    Returns the result records of each entity query, in entity order.
+    """
+    if not BATCHED_ENTITY_QUERIES or len(entity_queries) == 1:
+      return await asyncio.gather(*[
+          safe_query(query=cypher_query, params=params)
+          for cypher_query, params in entity_queries
+      ])
+
+    batched_query, batched_params = compile_batched_query(entity_queries)
+    grouped_records = await safe_query(query=batched_query, params=batched_params)
 
-    if result:
-        temp_df = pd.DataFrame(result)
-        temp_df.rename(columns=lambda x: f"{x}_{index}" if x != 'restaurant_id' else x, inplace=True)
-        return (temp_df, params)
+    results = [[] for _ in entity_queries]
+    for restaurant in grouped_records:
+        for entity in restaurant["entities"]:
+            results[entity["entity_index"] - 1].extend(entity["records"])
 
-    return None
+    return results
 
 async def generate_database_records(state):
-    entities = await get_entities(question=state.get('question'))
-    tolerance = 10
+    entities = state.get('entities') or await get_entities(question=state.get('question'))
+    emit_progress("entities", food_names=[entity.food_name for entity in entities.order_info])
+    tolerance = TOLERANCE
     passing_threshold = state.get('passing_threshold', 0.98)
 
-    tasks = [
-        process_entity(entity, tolerance, passing_threshold, i + 1)
-        for i, entity in enumerate(entities.order_info)
-    ]
+    entity_queries = await asyncio.gather(*[
+        prepare_entity_query(entity, tolerance, passing_threshold, index)
+        for index, entity in enumerate(entities.order_info)
+    ])
+
+    if len(entity_queries) == 1:
+      # Every row of a single-entity order is a deal, so the limit goes into the Cypher
+      cypher_query, params = entity_queries[0]
+      entity_queries = [top_k_cypher(cypher_query, params, params.get('limit', DEFAULT_DEAL_LIMIT))]
+
+    results = await execute_entity_queries(entity_queries) if entity_queries else []
+    emit_progress("entity_results", rows=[len(result) for result in results])
 
-    results = await asyncio.gather(*tasks)
+    # Entities with no match anywhere are left out of the deals
+    found_results = [result for result in results if result]
 
-    list_of_dataframe = [res[0] for res in results if res is not None]
-    if not list_of_dataframe:
+    if not found_results:
       return {
           'next_action': 'generate_cypher',
           'steps': ['extract_entities', 'no_parameter_found', 'go_for_general_query_agent']
       }
 
-    params = results[-1][1] if results[-1] is not None else {}
+    params = entity_queries[-1][1] if results[-1] else {}
 
-    output = await prepare_db_records(list_of_dataframe, params=params, n=len(list_of_dataframe))
+    output = await prepare_db_records(found_results, params=params)
     return {
         'next_action': 'generate_final_answer',
         'database_records': output,
         'steps': ['extract_entities', 'generate_parameter_based_cypher_query', 'execute_queries', 'generate_database_records']
-    }
+    }
\ No newline at end of file
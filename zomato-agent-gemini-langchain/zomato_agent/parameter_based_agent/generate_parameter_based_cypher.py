@@ -1,3 +1,10 @@
+import re
+import asyncio
+import itertools
+from functools import lru_cache
+from .. import safe_query
+from ..graph_migrations import migrated_properties
+
 entity_cypher_map = {
     'delivery_rating': '''
       r.delivery_rating IS NOT NULL AND r.delivery_rating <> 'not_available'
@@ -46,150 +53,342 @@ entity_cypher_map = {
       '''
 }
 
+# Predicates on the properties added by zomato_agent.graph_migrations, which
+# can use their range and text indexes: key -> ((label, property), predicate).
+# Each one replaces its entity_cypher_map entry once the graph has the property.
+migrated_entity_cypher_map = {
+    'delivery_rating': (('Restaurant', 'delivery_rating_num'), '''
+      r.delivery_rating_num >= $delivery_rating
+      '''),
+
+    'food_rating': (('Food', 'rating_num'), '''
+      f.rating_num >= $food_rating
+      '''),
+
+    'address': (('Restaurant', 'address_lower'), '''
+      r.address_lower CONTAINS $address
+      '''),
+
+    # The first name the restaurant must match, on its own so the text index
+    # can serve it; only sent once the graph has the property
+    'name_seek': (('Restaurant', 'name_lower'), '''
+      r.name_lower CONTAINS $name_seek
+      '''),
+
+    'name': (('Restaurant', 'name_lower'), '''
+      ALL(pair IN $name WHERE
+          (pair[1] = true AND r.name_lower CONTAINS toLower(pair[0]))
+          OR
+          (pair[1] = false AND NOT r.name_lower CONTAINS toLower(pair[0]))
+      )
+      '''),
+}
+
+# Parameters that only carry values; every other key changes the statement text
+VALUE_ONLY_KEYS = ['tolerance', 'food_rating_filter', 'food_price_filter', 'restaurant_rating_filter', 'limit', 'top_k']
+
+# Keys that are not WHERE predicates
+list_of_param_keys_not_for_where_clause = ['deliverables', 'food_scores', 'quantity'] + VALUE_ONLY_KEYS
+
+food_return_columns = [
+    'r.id AS restaurant_id',
+    'r.name AS restaurant',
+    'r.url AS zomato_page',
+    'r.delivery_rating AS delivery_rating',
+    'f.name AS food_name',
+    'f.bestseller AS bestseller',
+    'f.price AS price',
+    'f.type AS food_type',
+    'coalesce($quantity, 1) AS quantity',
+    '''CASE
+      WHEN f.rating IS NOT NULL AND f.rating <> 'not_available' THEN f.rating
+      ELSE NULL
+    END AS food_rating''',
+    'f.desc AS description',
+    'f.image_url AS food_image_url',
+]
+
+restaurant_return_columns = [
+    'r.id AS restaurant_id',
+    'r.name AS restaurant',
+    'r.url AS zomato_page',
+    'r.image_url AS restaurant_image_url',
+    '''CASE
+      WHEN r.delivery_rating IS NOT NULL AND r.delivery_rating <> 'not_available' THEN r.delivery_rating
+      ELSE NULL
+    END AS delivery_rating''',
+    '''CASE
+      WHEN r.dining_rating IS NOT NULL AND r.dining_rating <> 'not_available' THEN r.dining_rating
+      ELSE NULL
+    END AS dining_rating''',
+    'r.deliverables AS deliverables',
+    'r.phone_no AS phone_number',
+    'r.address AS address',
+]
+
+def query_shape(params):
+  """
+  Canonical shape of a parameter set: the sorted keys that change the Cypher
+  text. Equal shapes compile to the same statement whatever the key order.
+  """
+  return tuple(sorted(key for key in params if key not in VALUE_ONLY_KEYS))
+
+@lru_cache(maxsize=None)
+def cypher_template(shape, migrated=frozenset()):
+  """
+  Compiles the statement for one shape, once. Sending identical text for
+  every entity of the same shape lets Neo4j reuse its cached plan.
+  `migrated` holds the (label, property) pairs added by graph_migrations.
+  """
+  keys = set(shape)
+  predicate_map = {
+      **entity_cypher_map,
+      **{key: predicate for key, (required, predicate) in migrated_entity_cypher_map.items() if required in migrated},
+  }
+  clauses = []
+
+  if 'deliverables' in keys:
+    clauses.append(entity_cypher_map['deliverables'])
+
+  if 'food_scores' in keys:
+    clauses.append(entity_cypher_map['food_scores'])
+    clauses.append('MATCH (r:Restaurant)-[:DELIVERS]->(f:Food {id: fs.id})')
+  elif 'quantity' in keys:
+    clauses.append('MATCH (r:Restaurant)-[:DELIVERS]->(f:Food)')
+  else:
+    clauses.append('MATCH (r:Restaurant)')
+
+  predicates = [predicate_map[key] for key in shape if key not in list_of_param_keys_not_for_where_clause]
+  if predicates:
+    clauses.append('WHERE ' + ' AND '.join(predicates))
+
+  if 'food_scores' in keys or 'quantity' in keys:
+    columns = food_return_columns + (['fs.score AS similarity_score'] if 'food_scores' in keys else [])
+  else:
+    columns = list(restaurant_return_columns)
+
+  if 'deliverables' in keys:
+    columns.append('restaurant_score')
+
+  clauses.append('RETURN ' + ', '.join(columns))
+
+  return re.sub(r'\s+', ' ', ' '.join(clauses)).strip()
+
+def template_shape_count():
+  """
+  Number of distinct statement shapes compiled so far.
+  """
+  return cypher_template.cache_info().currsize
+
 async def build_cypher_query(entity, search_query, params):
-  cypher_query = '''
-  '''
   x = set(params.keys()) == set(['limit', 'food_price_filter'])
   x = x or set(params.keys()) == set(['limit', 'food_rating_filter'])
 
   if entity.quantity and (x or search_query or any(key in ['price', 'type', 'food_rating', 'bestseller'] for key in params.keys())):
     params["quantity"] = entity.quantity
 
-  if 'deliverables' in params:
-    cypher_query += entity_cypher_map['deliverables'] + ' '
+  migrated = await asyncio.to_thread(migrated_properties)
 
-  if 'food_scores' in params:
-    cypher_query += entity_cypher_map['food_scores'] + ' '
-    cypher_query += 'MATCH (r:Restaurant)-[:DELIVERS]->(f:Food {id: fs.id})' + ' '
-  elif 'quantity' in params:
-    cypher_query += 'MATCH (r:Restaurant)-[:DELIVERS]->(f:Food)' + ' '
-  else:
-    cypher_query += 'MATCH (r:Restaurant)' + ' '
-
-  where_cypher_query = ''''''
-
-  list_of_param_keys_not_for_where_clause = ['deliverables', 'food_scores', 'quantity', 'tolerance', 'food_rating_filter', 'food_price_filter', 'restaurant_rating_filter', 'limit']
-
-  for key in params.keys():
-    if key not in list_of_param_keys_not_for_where_clause:
-      if where_cypher_query:
-        where_cypher_query += 'AND ' + entity_cypher_map[key] + ' '
-      else:
-        where_cypher_query += 'WHERE ' + entity_cypher_map[key] + ' '
-
-  cypher_query += where_cypher_query + ' '
-
-  return_cypher_query = '''
-  '''
-  if 'food_scores' in params and 'deliverables' in params:
-    return_cypher_query = '''RETURN r.id AS restaurant_id,
-                              r.name AS restaurant,
-                              r.url  AS zomato_page,
-                              r.delivery_rating AS delivery_rating,
-                              f.name AS food_name,
-                              f.bestseller AS bestseller,
-                              f.price AS price,
-                              f.type AS food_type,
-                              coalesce($quantity, 1) AS quantity,
-                              CASE
-                              WHEN f.rating IS NOT NULL AND f.rating <> 'not_available' THEN f.rating
-                              ELSE NULL
-                              END AS food_rating,
-                              f.desc AS description,
-                              f.image_url AS food_image_url,
-                              fs.score AS similarity_score,
-                              restaurant_score
-                            '''
-  elif 'quantity' in params and 'deliverables' in params:
-    return_cypher_query = '''RETURN r.id AS restaurant_id,
-                              r.name AS restaurant,
-                              r.url  AS zomato_page,
-                              r.delivery_rating AS delivery_rating,
-                              f.name AS food_name,
-                              f.bestseller AS bestseller,
-                              f.price AS price,
-                              f.type AS food_type,
-                              coalesce($quantity, 1) AS quantity,
-                              CASE
-                              WHEN f.rating IS NOT NULL AND f.rating <> 'not_available' THEN f.rating
-                              ELSE NULL
-                              END AS food_rating,
-                              f.desc AS description,
-                              f.image_url AS food_image_url,
-                              restaurant_score
-                            '''
-
-  elif 'food_scores' in params:
-    return_cypher_query = '''RETURN r.id AS restaurant_id,
-                              r.name AS restaurant,
-                              r.url AS zomato_page,
-                              r.delivery_rating AS delivery_rating,
-                              f.name AS food_name,
-                              f.bestseller AS bestseller,
-                              f.price AS price,
-                              f.type AS food_type,
-                              coalesce($quantity, 1) AS quantity,
-                              CASE
-                                WHEN f.rating IS NOT NULL AND f.rating <> 'not_available' THEN f.rating
-                                ELSE NULL
-                              END AS food_rating,
-                              f.desc AS description,
-                              f.image_url AS food_image_url,
-                              fs.score AS similarity_score
-                            '''
-  elif 'quantity' in params:
-    return_cypher_query = '''RETURN r.id AS restaurant_id,
-                              r.name AS restaurant,
-                              r.url AS zomato_page,
-                              r.delivery_rating AS delivery_rating,
-                              f.name AS food_name,
-                              f.bestseller AS bestseller,
-                              f.price AS price,
-                              f.type AS food_type,
-                              coalesce($quantity, 1) AS quantity,
-                              CASE
-                                WHEN f.rating IS NOT NULL AND f.rating <> 'not_available' THEN f.rating
-                                ELSE NULL
-                              END AS food_rating,
-                              f.desc AS description,
-                              f.image_url AS food_image_url
-                            '''
-  elif 'deliverables' in params:
-    return_cypher_query = '''RETURN r.id AS restaurant_id,
-                              r.name AS restaurant,
-                              r.url AS zomato_page,
-                              r.image_url AS restaurant_image_url,
-                              CASE
-                                WHEN r.delivery_rating IS NOT NULL AND r.delivery_rating <> 'not_available' THEN r.delivery_rating
-                                ELSE NULL
-                              END AS delivery_rating,
-                              CASE
-                                WHEN r.dining_rating IS NOT NULL AND r.dining_rating <> 'not_available' THEN r.dining_rating
-                              ELSE NULL
-                              END AS dining_rating,
-                              r.deliverables AS deliverables,
-                              r.phone_no AS phone_number,
-                              r.address AS address,
-                              restaurant_score
-                            '''
-  else:
-    return_cypher_query = '''RETURN r.id AS restaurant_id,
-                              r.name AS restaurant,
-                              r.url AS zomato_page,
-                              r.image_url AS restaurant_image_url,
-                              CASE
-                                WHEN r.delivery_rating IS NOT NULL AND r.delivery_rating <> 'not_available' THEN r.delivery_rating
-                                ELSE NULL
-                              END AS delivery_rating,
-                              CASE
-                                WHEN r.dining_rating IS NOT NULL AND r.dining_rating <> 'not_available' THEN r.dining_rating
-                              ELSE NULL
-                              END AS dining_rating,
-                              r.deliverables AS deliverables,
-                              r.phone_no AS phone_number,
-                              r.address AS address
-                            '''
-
-  cypher_query += return_cypher_query
-
-  return cypher_query
\ No newline at end of file
+  required_names = [name for name, required in params.get('name', []) if required]
+  if required_names and ('Restaurant', 'name_lower') in migrated:
+    params['name_seek'] = required_names[0]
+
+  return cypher_template(query_shape(params), migrated)
+
+def return_columns(cypher_query):
+  """
+  Column names of the final RETURN clause of a statement built by build_cypher_query.
+  """
+  return_clause = cypher_query[cypher_query.rindex('RETURN') + len('RETURN'):]
+
+  items, depth, current = [], 0, ''
+  for char in return_clause:
+    if char == ',' and depth == 0:
+      items.append(current)
+      current = ''
+      continue
+    depth += (char == '(') - (char == ')')
+    current += char
+  items.append(current)
+
+  return [re.split(r'\s+AS\s+', item.strip())[-1].strip() for item in items if item.strip()]
+
+@lru_cache(maxsize=1024)
+def batched_statement(cypher_queries):
+  """
+  The batched statement for a tuple of entity statements, and the parameter
+  names each of them references. Cached like the per-entity templates, so
+  repeated order shapes send identical text.
+  """
+  branches = []
+  parameter_names = []
+
+  for index, cypher_query in enumerate(cypher_queries, start=1):
+    prefix = f'e{index}_'
+    parameter_names.append(sorted(set(re.findall(r'\$(\w+)', cypher_query))))
+
+    body = re.sub(r'\$(\w+)', lambda match: f'${prefix}{match.group(1)}', cypher_query)
+    record = ', '.join(f'{column}: {column}' for column in return_columns(cypher_query))
+
+    branches.append(
+      f'CALL {{ {body} }} RETURN {index} AS entity_index, restaurant_id, {{{record}}} AS record'
+    )
+
+  batched_query = (
+    'CALL { ' + ' UNION ALL '.join(branches) + ' } '
+    'WITH restaurant_id, entity_index, collect(record) AS records '
+    'RETURN restaurant_id, collect({entity_index: entity_index, records: records}) AS entities'
+  )
+
+  return batched_query, parameter_names
+
+def compile_batched_query(entity_queries):
+  """
+  Compiles the per-entity (cypher_query, params) pairs of one order into a single
+  statement. Each entity runs in its own CALL {} subquery with its parameters
+  prefixed by `e<index>_`, and the rows come back grouped by restaurant:
+
+    restaurant_id, entities: [{entity_index, records: [...]}, ...]
+  """
+  batched_query, parameter_names = batched_statement(tuple(cypher_query for cypher_query, _ in entity_queries))
+
+  # Every referenced parameter is passed, missing ones as null (e.g. $quantity)
+  batched_params = {
+      f'e{index}_{name}': params.get(name)
+      for index, ((_, params), names) in enumerate(zip(entity_queries, parameter_names), start=1)
+      for name in names
+  }
+
+  return batched_query, batched_params
+
+ORDER_FILTER_KEYS = ['food_price_filter', 'food_rating_filter', 'restaurant_rating_filter']
+
+def rank_expressions(columns, order_filter):
+  """
+  Cypher for how deal_combinations ranks the candidates of a single dish,
+  lower first: the similarity key of mean_similarity_key and the tiebreak of
+  tiebreak_column, over the named columns of a statement.
+  """
+  scores = [column for column in ['similarity_score', 'restaurant_score'] if column in columns]
+  similarity = f"round(-coalesce({', '.join(scores)}, 0.0), 9)" if scores else '0.0'
+
+  if 'food_price_filter' in order_filter:
+    cost = '0.0'
+    if 'price' in columns and 'quantity' in columns:
+      cost = 'coalesce(toFloatOrNull(price) * toInteger(toFloatOrNull(quantity)), 0.0)'
+    return similarity, (f'-{cost}' if order_filter['food_price_filter'] == 'DESC' else cost)
+
+  for filter_key, rating_key in [('food_rating_filter', 'food_rating'), ('restaurant_rating_filter', 'delivery_rating')]:
+    if filter_key in order_filter:
+      # Unrated rows go last
+      if rating_key not in columns:
+        return similarity, '0.0'
+      if order_filter[filter_key] == 'DESC':
+        return similarity, f'coalesce(-toFloatOrNull({rating_key}), 0.0)'
+      return similarity, f'coalesce(toFloatOrNull({rating_key}), 1e3)'
+
+  return similarity, ('-coalesce(restaurant_score, 0.0)' if 'restaurant_score' in columns else '0.0')
+
+@lru_cache(maxsize=None)
+def top_k_statement(cypher_query, order_filter):
+  """
+  `cypher_query` cut to the rows that can make the first $top_k deals: its
+  distinct rows (CandidateTable drops duplicates) ranked like deal_combinations,
+  keeping every row that ties with the last one, since the client breaks those
+  ties by arrival order.
+  """
+  columns = return_columns(cypher_query)
+  similarity, tiebreak = rank_expressions(columns, dict(order_filter))
+  body, _, returned = cypher_query.rpartition(' RETURN ')
+  row = ', '.join(f'{column}: {column}' for column in columns)
+
+  return (
+    f'{body} WITH DISTINCT {returned} '
+    f'WITH *, {similarity} AS rank_similarity, {tiebreak} AS rank_tiebreak '
+    'ORDER BY rank_similarity, rank_tiebreak '
+    f'WITH collect({{{row}, rank_similarity: rank_similarity, rank_tiebreak: rank_tiebreak}}) AS rows '
+    'WITH rows, rows[toInteger($top_k) - 1] AS last '
+    'UNWIND rows AS row '
+    'WITH row, last WHERE last IS NULL OR row.rank_similarity < last.rank_similarity '
+    'OR (row.rank_similarity = last.rank_similarity AND row.rank_tiebreak <= last.rank_tiebreak) '
+    'RETURN ' + ', '.join(f'row.{column} AS {column}' for column in columns)
+  )
+
+def top_k_cypher(cypher_query, params, k):
+  """
+  Pushes the deal limit of a single-entity order into the statement built by
+  build_cypher_query. Every row is a deal there, so the client still ranks and
+  cuts the rows that come back, but gets the same top k deals as from all rows.
+  """
+  order_filter = tuple((key, params[key]) for key in ORDER_FILTER_KEYS if key in params)
+  return top_k_statement(cypher_query, order_filter), {**params, 'top_k': max(int(k), 1)}
+
+# Representative values, so pre-warmed plans are compiled for the parameter
+# types real queries send
+SAMPLE_PARAMS = {
+    'delivery_rating': 4.0,
+    'phone_number': '',
+    'address': '',
+    'deliverables': 'pizza',
+    'name': [['', True]],
+    'name_seek': '',
+    'food_scores': [{'id': '', 'score': 1.0}],
+    'type': 'veg',
+    'food_rating': 4.0,
+    'price': 100.0,
+    'tolerance': 10,
+    'quantity': 1,
+    'top_k': 1000,
+}
+
+def reachable_shapes(migrated=frozenset()):
+  """
+  Every shape build_cypher_query can produce from entity_cypher_map: any mix
+  of restaurant predicates, with or without the deliverables fulltext search,
+  and food predicates only where a Food node is matched. A required name adds
+  name_seek once the graph has ('Restaurant', 'name_lower').
+  """
+  restaurant_keys = ['delivery_rating', 'phone_number', 'address']
+  name_options = [[], ['name']] + ([['name', 'name_seek']] if ('Restaurant', 'name_lower') in migrated else [])
+  food_keys = ['bestseller', 'type', 'food_rating', 'price']
+  food_matches = [['quantity'], ['food_scores'], ['food_scores', 'quantity']]
+
+  for restaurant_subset, name_predicates in itertools.product(itertools.product([False, True], repeat=len(restaurant_keys)), name_options):
+    restaurant_predicates = [key for key, used in zip(restaurant_keys, restaurant_subset) if used] + name_predicates
+    for deliverables in [[], ['deliverables']]:
+      yield tuple(sorted(restaurant_predicates + deliverables))
+
+      for food_match in food_matches:
+        for food_subset in itertools.product([False, True], repeat=len(food_keys)):
+          food_predicates = [key for key, used in zip(food_keys, food_subset) if used]
+          yield tuple(sorted(restaurant_predicates + deliverables + food_match + food_predicates))
+
+async def prewarm_plan_cache(concurrency=8, limit=None):
+  """
+  Runs EXPLAIN for the reachable shapes, and for their single-entity top-k
+  variant, so Neo4j has the plans cached before the first query needs them.
+  With `limit` only that many of the simplest shapes (fewest predicates, the
+  most common orders) are planned. Returns the number of statements planned.
+  """
+  semaphore = asyncio.Semaphore(concurrency)
+
+  async def explain(cypher_query):
+    async with semaphore:
+      try:
+        await safe_query(query='EXPLAIN ' + cypher_query, params=SAMPLE_PARAMS)
+        return 1
+      except Exception as e:
+        print(f"Plan pre-warm failed: {e}")
+        return 0
+
+  migrated = await asyncio.to_thread(migrated_properties)
+
+  shapes = sorted(reachable_shapes(migrated), key=len)[:limit]
+  statements = []
+  for shape in shapes:
+    cypher_query = cypher_template(shape, migrated)
+    statements += [cypher_query, top_k_statement(cypher_query, ())]
+
+  planned = sum(await asyncio.gather(*[explain(statement) for statement in statements]))
+  print(f"Pre-warmed {planned} Cypher plans for {template_shape_count()} statement shapes")
+  return planned
@@ -1,28 +1,97 @@
+import os
 import re
-from langchain_neo4j import Neo4jVector
-from .. import embedding_model
+from .. import get_embedding_model, lazy_resource, get_embedding_dimension, safe_query
 
-food_vector_index = Neo4jVector.from_existing_graph(
-    embedding=embedding_model,
-    index_name="food_embedding_index",             # vector index name
-    keyword_index_name="food_fulltext_index",      # explicitly pass keyword index name
-    search_type="hybrid",                          # hybrid search: vector + keyword
-    node_label="Food",
-    text_node_properties=["price", "bestseller", "name", "type", "desc", "rating", "category", "restaurant_name", "id"],
-    embedding_node_property="embedding"
-)
+FOOD_VECTOR_INDEX = "food_embedding_index"
+FOOD_FULLTEXT_INDEX = "food_fulltext_index"
 
+# Adaptive k: start small and widen only while every returned food is still above
+# the threshold, up to the 1000 the search used to fetch unconditionally
+HYBRID_SEARCH_INITIAL_K = int(os.getenv("HYBRID_SEARCH_INITIAL_K", "50"))
+HYBRID_SEARCH_MAX_K = int(os.getenv("HYBRID_SEARCH_MAX_K", "1000"))
+HYBRID_SEARCH_K_GROWTH = 4
+
+@lazy_resource
+def get_food_vector_index():
+  """
+  Neo4jVector over the Food nodes. Not used while serving requests anymore, but
+  building it creates the indexes and embeds any Food node that has no
+  embedding yet, so run it after ingesting new foods.
+  """
+  from langchain_neo4j import Neo4jVector # deferred, importing langchain_neo4j is slow
+
+  return Neo4jVector.from_existing_graph(
+      embedding=get_embedding_model(),
+      index_name=FOOD_VECTOR_INDEX,                  # vector index name
+      keyword_index_name=FOOD_FULLTEXT_INDEX,        # explicitly pass keyword index name
+      search_type="hybrid",                          # hybrid search: vector + keyword
+      node_label="Food",
+      text_node_properties=["price", "bestseller", "name", "type", "desc", "rating", "category", "restaurant_name", "id"],
+      embedding_node_property="embedding",
+      embedding_dimension=get_embedding_dimension(),
+  )
+
+# Same scoring as Neo4jVector's hybrid search: each index's scores are divided
+# by that index's best score and a node keeps the higher of the two. Only ids
+# and scores above the threshold leave the database.
+HYBRID_SCORES_QUERY = '''
+CALL {
+  CALL db.index.vector.queryNodes($vector_index, $k, $embedding) YIELD node, score
+  WITH collect({node: node, score: score}) AS nodes, max(score) AS max_score
+  UNWIND nodes AS n
+  RETURN n.node AS node, n.score / max_score AS score
+  UNION
+  CALL db.index.fulltext.queryNodes($fulltext_index, $query_text, {limit: $k}) YIELD node, score
+  WITH collect({node: node, score: score}) AS nodes, max(score) AS max_score
+  UNWIND nodes AS n
+  RETURN n.node AS node, n.score / max_score AS score
+}
+WITH node, max(score) AS score
+WHERE score >= $passing_threshold
+RETURN node.id AS id, score
+ORDER BY score DESC
+LIMIT $k
+'''
+
+VECTOR_SCORES_QUERY = '''
+CALL db.index.vector.queryNodes($vector_index, $k, $embedding) YIELD node, score
+WITH collect({node: node, score: score}) AS nodes, max(score) AS max_score
+UNWIND nodes AS n
+WITH n.node AS node, n.score / max_score AS score
+WHERE score >= $passing_threshold
+RETURN node.id AS id, score
+ORDER BY score DESC
+'''
+
+LUCENE_SPECIAL_CHARS = re.compile(r'[+\-&|!(){}\[\]^"~*?:\\/]')
+
+def to_fulltext_query(text):
+  return " ".join(LUCENE_SPECIAL_CHARS.sub(" ", text).split())
 
 async def get_food_scores(search_query: str, passing_threshold:float):
-  food_scores = []
-  hybrid_search_output = food_vector_index.similarity_search_with_score(query=search_query, k=1000)
-
-  for doc, score in hybrid_search_output:
-      if score < passing_threshold:
-          break
-      match = re.search(r'id:\s*([a-f0-9\-]+)', doc.page_content)
-      if match:
-          node_id = match.group(1)
-          food_scores.append({"id": node_id, "score": score})
-
-  return food_scores
+  embedding = await get_embedding_model().aembed_query(search_query)
+  query_text = to_fulltext_query(search_query)
+
+  params = {
+      "vector_index": FOOD_VECTOR_INDEX,
+      "fulltext_index": FOOD_FULLTEXT_INDEX,
+      "embedding": embedding,
+      "query_text": query_text,
+      "passing_threshold": passing_threshold,
+  }
+
+  k = HYBRID_SEARCH_INITIAL_K
+  while True:
+      params["k"] = k
+      food_scores = await safe_query(
+          query=HYBRID_SCORES_QUERY if query_text else VECTOR_SCORES_QUERY,
+          params=params,
+      )
+
+      # Fewer than k foods above the threshold means the k-th candidate of each
+      # index already fell below it, so a wider search can't add any
+      if len(food_scores) < k or k >= HYBRID_SEARCH_MAX_K:
+        break
+      k = min(k * HYBRID_SEARCH_K_GROWTH, HYBRID_SEARCH_MAX_K)
+
+  return [food_score for food_score in food_scores if food_score["id"]]
@@ -0,0 +1,80 @@
+import os
+import json
+import asyncio
+from . import safe_query, get_embedding_model
+from .cache import SemanticCache
+from .tracing import record_cache
+
+
+RESULT_CACHE_SIZE = int(os.getenv("RESULT_CACHE_SIZE", "512"))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", "3600"))
+
+# Cosine similarity above which a differently worded question reuses a cached
+# answer, e.g. 0.97. Unset: only questions that normalize identically match.
+RESULT_CACHE_SIMILARITY = os.getenv("RESULT_CACHE_SIMILARITY")
+
+# The graph data version is the static GRAPH_DATA_VERSION (set it on every
+# ingest) combined with the result of GRAPH_DATA_VERSION_QUERY, re-read every
+# GRAPH_DATA_VERSION_CHECK_INTERVAL seconds by data_version_probe, off the
+# request path. The default query returns the node counts, which Neo4j answers
+# from its count store.
+GRAPH_DATA_VERSION = os.getenv("GRAPH_DATA_VERSION", "")
+GRAPH_DATA_VERSION_QUERY = os.getenv(
+    "GRAPH_DATA_VERSION_QUERY",
+    "MATCH (r:Restaurant) WITH count(r) AS restaurants MATCH (f:Food) RETURN restaurants, count(f) AS foods",
+)
+GRAPH_DATA_VERSION_CHECK_INTERVAL = float(os.getenv("GRAPH_DATA_VERSION_CHECK_INTERVAL", "60"))
+
+result_cache = SemanticCache(
+    maxsize=RESULT_CACHE_SIZE,
+    ttl=RESULT_CACHE_TTL,
+    similarity_threshold=float(RESULT_CACHE_SIMILARITY) if RESULT_CACHE_SIMILARITY else None,
+)
+
+_data_version = {"value": None}
+
+async def refresh_data_version():
+    """
+    Re-reads the graph data version, clearing the result cache when it differs
+    from the one seen previously.
+    """
+    records = await safe_query(query=GRAPH_DATA_VERSION_QUERY) if GRAPH_DATA_VERSION_QUERY else []
+    version = f"{GRAPH_DATA_VERSION}:{json.dumps(records, sort_keys=True, default=str)}"
+
+    if _data_version["value"] is not None and version != _data_version["value"]:
+      print("Graph data version changed, clearing the result cache")
+      result_cache.clear()
+
+    _data_version["value"] = version
+
+async def data_version_probe():
+    while True:
+        try:
+          await refresh_data_version()
+        except Exception as e:
+          print(f"Graph data version probe failed: {e}")
+        await asyncio.sleep(GRAPH_DATA_VERSION_CHECK_INTERVAL)
+
+async def get_data_version():
+    if _data_version["value"] is None:
+      await refresh_data_version()
+    return _data_version["value"]
+
+async def _embed(text):
+    return await get_embedding_model().aembed_query(text)
+
+async def get_cached_result(question, passing_threshold):
+    if RESULT_CACHE_SIZE <= 0:
+      return None
+
+    namespace = (round(passing_threshold, 4), await get_data_version())
+    cached_result = await result_cache.aget(question, namespace, embed=_embed)
+    record_cache("result", cached_result is not None)
+    return cached_result
+
+async def set_cached_result(question, passing_threshold, result):
+    if RESULT_CACHE_SIZE <= 0:
+      return
+
+    namespace = (round(passing_threshold, 4), await get_data_version())
+    await result_cache.aset(question, namespace, result, embed=_embed)
@@ -0,0 +1,108 @@
+import os
+import re
+import copy
+import json
+import asyncio
+from .governor import llm_governor, estimate_tokens
+from .cassette import cassette
+
+
+# Concurrent identical LLM, embedding and read query calls share one call
+SINGLE_FLIGHT = os.getenv("SINGLE_FLIGHT", "true").lower() == "true"
+
+WRITE_CLAUSE = re.compile(r"\b(CREATE|MERGE|SET|DELETE|REMOVE|DROP|FOREACH|LOAD\s+CSV)\b", re.IGNORECASE)
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls with the same key: the first caller starts the
+    call and every caller that arrives while it is in flight awaits the same
+    task. Nothing is cached; the key is forgotten as soon as the call finishes.
+
+    Callers other than the one that started the call get a deep copy of the
+    result, so none of them can mutate another's records. Cancelling a caller
+    only cancels the shared call when no other caller is waiting on it.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.stats = {"calls": 0, "merged": 0}
+
+    async def do(self, key, call):
+        entry = self._inflight.get(key)
+        leader = entry is None
+
+        if leader:
+          entry = {"task": asyncio.ensure_future(call()), "waiters": 0}
+          self._inflight[key] = entry
+          entry["task"].add_done_callback(lambda _: self._forget(key, entry))
+          self.stats["calls"] += 1
+        else:
+          self.stats["merged"] += 1
+
+        entry["waiters"] += 1
+        try:
+          result = await asyncio.shield(entry["task"])
+        except asyncio.CancelledError:
+          if entry["waiters"] == 1:
+            entry["task"].cancel()
+          raise
+        finally:
+          entry["waiters"] -= 1
+
+        return result if leader else copy.deepcopy(result)
+
+    def _forget(self, key, entry):
+        if self._inflight.get(key) is entry:
+          del self._inflight[key]
+
+    def summary(self):
+        total_calls = self.stats["calls"] + self.stats["merged"]
+        return {
+            **self.stats,
+            "in_flight": len(self._inflight),
+            "merged_ratio": round(self.stats["merged"] / total_calls, 3) if total_calls else 0.0,
+        }
+
+
+llm_flight = SingleFlight()
+embedding_flight = SingleFlight()
+query_flight = SingleFlight()
+
+def canonical(value):
+    return json.dumps(value, sort_keys=True, default=repr)
+
+async def ainvoke_coalesced(chain, inputs, priority=None):
+    """
+    chain.ainvoke(inputs) through the LLM governor in the given priority class,
+    shared with any identical call to the same chain that is already in flight.
+    The priority class also names the chain on the cassette.
+    """
+    key = canonical(inputs)
+
+    def call():
+        return llm_governor.run(
+            priority, lambda: cassette.run("llm", [priority, inputs], lambda: chain.ainvoke(inputs)), tokens=estimate_tokens(key)
+        )
+
+    if not SINGLE_FLIGHT:
+      return await call()
+
+    return await llm_flight.do((id(chain), key), call)
+
+async def query_coalesced(run_query, query, params=None):
+    """
+    run_query(query, params), shared with an identical read already in flight.
+    Statements that write are always run on their own.
+    """
+    if not SINGLE_FLIGHT or WRITE_CLAUSE.search(query):
+      return await run_query(query, params)
+
+    return await query_flight.do((query, canonical(params or {})), lambda: run_query(query, params))
+
+def summary():
+    return {
+        "llm": llm_flight.summary(),
+        "embedding": embedding_flight.summary(),
+        "query": query_flight.summary(),
+    }
@@ -0,0 +1,134 @@
+"""
+Prebuilt on-disk snapshot of the resources that would otherwise be fetched over
+the network the first time they are used: the graph schema, the embedding
+dimension, the FAISS index over the entity extraction examples and the
+embeddings of the few-shot Cypher examples.
+Building it also embeds any Food node that has no embedding yet.
+
+Build it once per deployment (e.g. while building the Docker image) with:
+
+    python -m zomato_agent.snapshot
+"""
+import os
+import json
+import hashlib
+from functools import lru_cache
+from .cassette import cassette
+
+
+CURRENT_DIR = os.path.dirname(__file__)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", os.path.join(CURRENT_DIR, "snapshot"))
+MANIFEST_FILE = "manifest.json"
+ENTITY_EXAMPLES_INDEX = "entity_examples_faiss"
+
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+@lru_cache(maxsize=None)
+def load_manifest():
+    manifest_path = os.path.join(SNAPSHOT_DIR, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+      return {}
+
+    with open(manifest_path, 'r') as f:
+        return json.load(f)
+
+def snapshot_entry(key, source_file=None):
+    """
+    Returns the snapshot entry stored under `key`, or None when there is no
+    snapshot or, for entries built from a file, when that file has changed since.
+    Recording and replaying a cassette never use the snapshot, so both fetch
+    the same resources whether or not a machine has one.
+    """
+    if cassette.mode != "off":
+      return None
+
+    entry = load_manifest().get(key)
+    if not entry:
+      return None
+
+    if source_file and entry.get("digest") != file_digest(source_file):
+      return None
+
+    return entry
+
+def snapshot_path(name):
+    return os.path.join(SNAPSHOT_DIR, name)
+
+def food_vocabulary(enhanced_graph, min_count=3):
+    """
+    Words that appear in at least `min_count` Food or Category names, used by the
+    guardrails' local classifier.
+    """
+    import re
+    from collections import Counter
+
+    names = enhanced_graph.query(
+        "MATCH (f:Food) RETURN f.name AS name UNION ALL MATCH (c:Category) RETURN c.name AS name"
+    )
+    counts = Counter(
+        word
+        for record in names if record["name"]
+        for word in set(re.findall(r"[a-z]+", record["name"].lower()))
+        if len(word) > 2
+    )
+    return sorted(word for word, count in counts.items() if count >= min_count)
+
+def build_snapshot():
+    """
+    Connects to Neo4j and Gemini once and writes everything the workers need to
+    start without doing so.
+    """
+    from . import get_enhanced_graph, get_embedding_model, EMBEDDING_MODEL
+    from .parameter_based_agent import entities
+    from .general_query_agent import generate_cypher
+    from .parameter_based_agent.hybrid_search import get_food_vector_index
+
+    os.makedirs(SNAPSHOT_DIR, exist_ok=True)
+    manifest = {}
+
+    enhanced_graph = get_enhanced_graph()
+    manifest["graph_schema"] = {
+        "schema": enhanced_graph.schema,
+        "structured_schema": enhanced_graph.structured_schema,
+    }
+
+    manifest["embedding"] = {
+        "model": EMBEDDING_MODEL,
+        "dimension": len(get_embedding_model().embed_query("dimension probe")),
+    }
+
+    # Makes sure the Food indexes exist and every Food node has an embedding
+    get_food_vector_index()
+
+    vectorstore = entities.build_entity_examples_vectorstore()
+    vectorstore.save_local(snapshot_path(ENTITY_EXAMPLES_INDEX))
+    manifest["entity_examples"] = {
+        "digest": file_digest(entities.file_path),
+        "index": ENTITY_EXAMPLES_INDEX,
+    }
+
+    import numpy as np
+
+    np.save(snapshot_path(generate_cypher.EXAMPLE_EMBEDDINGS_FILE), generate_cypher.get_example_selector().matrix)
+    manifest["cypher_examples"] = {
+        "digest": file_digest(generate_cypher.file_path),
+        "model": EMBEDDING_MODEL,
+        "embeddings": generate_cypher.EXAMPLE_EMBEDDINGS_FILE,
+    }
+
+    manifest["food_vocabulary"] = {
+        "words": food_vocabulary(enhanced_graph),
+    }
+
+    with open(snapshot_path(MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=2, default=str)
+
+    load_manifest.cache_clear()
+    print(f"Snapshot written to {SNAPSHOT_DIR}")
+
+
+if __name__ == "__main__":
+    build_snapshot()
@@ -0,0 +1,44 @@
+import threading
+
+
+class FastPathStats:
+    """
+    Counts how many LLM calls a local fast path settled on its own and estimates
+    the latency (and tokens, when the LLM calls report them) saved, using the
+    mean of the calls that did reach the LLM.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.local_calls = 0
+        self.local_seconds = 0.0
+        self.llm_calls = 0
+        self.llm_seconds = 0.0
+        self.llm_tokens = 0
+
+    def record_local(self, seconds):
+        with self._lock:
+          self.local_calls += 1
+          self.local_seconds += seconds
+
+    def record_llm(self, seconds, tokens=0):
+        with self._lock:
+          self.llm_calls += 1
+          self.llm_seconds += seconds
+          self.llm_tokens += tokens
+
+    def summary(self):
+        with self._lock:
+          total_calls = self.local_calls + self.llm_calls
+          mean_llm_seconds = self.llm_seconds / self.llm_calls if self.llm_calls else 0.0
+          mean_llm_tokens = self.llm_tokens / self.llm_calls if self.llm_calls else 0.0
+          return {
+              "calls": total_calls,
+              "llm_calls": self.llm_calls,
+              "llm_calls_avoided": self.local_calls,
+              "avoided_ratio": round(self.local_calls / total_calls, 3) if total_calls else 0.0,
+              "mean_llm_seconds": round(mean_llm_seconds, 3),
+              "estimated_seconds_saved": round(max(self.local_calls * mean_llm_seconds - self.local_seconds, 0.0), 3),
+              "mean_llm_tokens": round(mean_llm_tokens, 1),
+              "estimated_tokens_saved": round(self.local_calls * mean_llm_tokens),
+          }
@@ -0,0 +1,111 @@
+import os
+import json
+import time
+from . import get_langgraph
+from .result_cache import get_cached_result, set_cached_result
+from .governor import Overloaded
+
+
+# Deal records per "records" event
+STREAM_BATCH_SIZE = int(os.getenv("STREAM_BATCH_SIZE", "20"))
+
+def record_events(database_records, offset=0):
+    """
+    "records" events for a node's database_records: ranked deal records in
+    batches, or one "message" event when the answer is text (guardrail or no
+    result messages).
+    """
+    if not isinstance(database_records, list):
+      yield {"event": "message", "text": database_records}
+      return
+
+    for start in range(0, len(database_records), STREAM_BATCH_SIZE):
+        yield {
+            "event": "records",
+            "offset": offset + start,
+            "records": database_records[start:start + STREAM_BATCH_SIZE],
+        }
+
+async def stream_query(question, passing_threshold):
+    """
+    Runs the graph for one question, yielding events as they happen:
+
+      node            a node finished, with its steps and next action
+      entities, search, entity_results
+                      progress inside the parameter-based agent
+      records         a batch of ranked database records
+      message         a text answer instead of records
+      done            the run finished, with the final steps and record count
+      error           the run failed; nothing follows it (with retry_after when
+                      the Gemini governor shed it)
+
+    The final result is stored in the result cache like a /query answer, and a
+    cached answer is replayed as its records followed by "done".
+    """
+    start = time.perf_counter()
+
+    cached_result = await get_cached_result(question, passing_threshold)
+    if cached_result is not None:
+      for event in record_events(cached_result.get("database_records")):
+          yield event
+      yield {
+          "event": "done",
+          "steps": cached_result["steps"] + ["result_cache"],
+          "cypher_statement": cached_result.get("cypher_statement"),
+          "total_records": len(cached_result["database_records"]) if isinstance(cached_result.get("database_records"), list) else None,
+          "seconds": round(time.perf_counter() - start, 3),
+      }
+      return
+
+    result = {"steps": []}
+    try:
+      async for mode, chunk in get_langgraph().astream(
+          {"question": question, "passing_threshold": passing_threshold},
+          stream_mode=["updates", "custom"],
+      ):
+          if mode == "custom":
+            yield {**chunk, "seconds": round(time.perf_counter() - start, 3)}
+            continue
+
+          for node, update in chunk.items():
+              update = update or {}
+              yield {
+                  "event": "node",
+                  "node": node,
+                  "steps": update.get("steps", []),
+                  "next_action": update.get("next_action"),
+                  "seconds": round(time.perf_counter() - start, 3),
+              }
+
+              result["steps"] = result["steps"] + update.get("steps", [])
+              for key in ["answer", "cypher_statement"]:
+                  if key in update:
+                    result[key] = update[key]
+
+              if update.get("database_records") is not None:
+                result["database_records"] = update["database_records"]
+                for event in record_events(update["database_records"]):
+                    yield event
+    except Overloaded as e:
+      yield {"event": "error", "detail": str(e), "retry_after": e.retry_after}
+      return
+    except Exception as e:
+      yield {"event": "error", "detail": str(e)}
+      return
+
+    await set_cached_result(question, passing_threshold, result)
+
+    database_records = result.get("database_records")
+    yield {
+        "event": "done",
+        "steps": result["steps"],
+        "cypher_statement": result.get("cypher_statement"),
+        "total_records": len(database_records) if isinstance(database_records, list) else None,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+def encode_ndjson(event):
+    return json.dumps(event, default=str) + "\n"
+
+def encode_sse(event):
+    return f"event: {event['event']}\ndata: {json.dumps(event, default=str)}\n\n"
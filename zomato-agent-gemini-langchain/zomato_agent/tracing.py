@@ -0,0 +1,254 @@
+"""
+Per-node tracing and Prometheus-style metrics.
+
+Every LangGraph node runs in a span (`traced`), and the LLM token usage,
+Neo4j queries and cache lookups made while it runs are attributed to it
+through context variables, including calls made from tasks and threads the
+node starts. The counters are aggregated for `/metrics`. When a request opts
+in with `trace: true`, its spans are also returned with the response.
+"""
+import time
+import threading
+import functools
+import contextvars
+
+
+# Seconds
+HISTOGRAM_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+current_trace = contextvars.ContextVar("zomato_trace", default=None)
+current_span = contextvars.ContextVar("zomato_span", default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * len(HISTOGRAM_BUCKETS)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(HISTOGRAM_BUCKETS):
+            if value <= bound:
+              self.counts[i] += 1
+
+
+class Metrics:
+    """
+    Counters and histograms keyed by (name, labels), rendered in the
+    Prometheus text exposition format.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+        self.help = {}
+
+    def inc(self, name, labels, value=1, help=""):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+          self.help.setdefault(name, (help, "counter"))
+          self.counters[key] = self.counters.get(key, 0) + value
+
+    def observe(self, name, labels, value, help=""):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+          self.help.setdefault(name, (help, "histogram"))
+          self.histograms.setdefault(key, Histogram()).observe(value)
+
+    @staticmethod
+    def _labels(labels, extra=()):
+        pairs = list(labels) + list(extra)
+        if not pairs:
+          return ""
+        escaped = (str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, value in pairs)
+        return "{" + ",".join(f'{key}="{value}"' for (key, _), value in zip(pairs, escaped)) + "}"
+
+    def render(self, gauges=()):
+        """
+        The metrics as Prometheus text, followed by `gauges`: (name, help,
+        labels, value) read at scrape time.
+        """
+        lines = []
+        with self._lock:
+          for name in sorted(self.help):
+              help, kind = self.help[name]
+              lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+
+              if kind == "counter":
+                for (key_name, labels), value in sorted(self.counters.items()):
+                    if key_name == name:
+                      lines.append(f"{name}{self._labels(labels)} {value:g}")
+                continue
+
+              for (key_name, labels), histogram in sorted(self.histograms.items(), key=lambda item: item[0]):
+                  if key_name != name:
+                    continue
+                  for bound, count in zip(HISTOGRAM_BUCKETS, histogram.counts):
+                      lines.append(f"{name}_bucket{self._labels(labels, [('le', f'{bound:g}')])} {count}")
+                  lines.append(f"{name}_bucket{self._labels(labels, [('le', '+Inf')])} {histogram.count}")
+                  lines.append(f"{name}_sum{self._labels(labels)} {histogram.sum:g}")
+                  lines.append(f"{name}_count{self._labels(labels)} {histogram.count}")
+
+        documented = set()
+        for name, help, labels, value in gauges:
+            if name not in documented:
+              lines += [f"# HELP {name} {help}", f"# TYPE {name} gauge"]
+              documented.add(name)
+            lines.append(f"{name}{self._labels(sorted(labels.items()))} {value:g}")
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+class Span:
+    def __init__(self, node, trace_start):
+        self.node = node
+        self.start = time.perf_counter() - trace_start
+        self.seconds = None
+        self.llm_calls = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.neo4j_queries = 0
+        self.neo4j_server_seconds = 0.0
+        self.neo4j_rows = 0
+        self.cache_hits = {}
+
+    def to_dict(self):
+        return {
+            "node": self.node,
+            "start": round(self.start, 4),
+            "seconds": round(self.seconds, 4) if self.seconds is not None else None,
+            "llm_calls": self.llm_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "neo4j_queries": self.neo4j_queries,
+            "neo4j_server_seconds": round(self.neo4j_server_seconds, 4),
+            "neo4j_rows": self.neo4j_rows,
+            "cache_hits": self.cache_hits,
+        }
+
+
+class Trace:
+    """
+    The spans of one request. Work outside any node (e.g. the result cache
+    lookup in app.py) is recorded in a "request" span.
+    """
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.spans = []
+        self.request_span = self.span("request")
+
+    def span(self, node):
+        span = Span(node, self.start)
+        self.spans.append(span)
+        return span
+
+    def to_dict(self):
+        return {
+            "total_seconds": round(time.perf_counter() - self.start, 4),
+            "spans": [span.to_dict() for span in self.spans],
+        }
+
+def _span():
+    span = current_span.get()
+    if span is None and current_trace.get() is not None:
+      span = current_trace.get().request_span
+    return span
+
+def _node():
+    span = current_span.get()
+    return span.node if span is not None else "none"
+
+def start_trace():
+    """
+    Starts tracing the current request; returns the Trace and the token to
+    pass to `end_trace`.
+    """
+    trace = Trace()
+    return trace, current_trace.set(trace)
+
+def end_trace(trace, token):
+    trace.request_span.seconds = time.perf_counter() - trace.start
+    metrics.observe("zomato_request_duration_seconds", {}, trace.request_span.seconds, help="Wall time of a /query or /query/stream request.")
+    current_trace.reset(token)
+
+def traced(node):
+    """
+    Wraps a LangGraph node so it runs in its own span.
+    """
+    @functools.wraps(node)
+    async def traced_node(state):
+        trace = current_trace.get()
+        span = trace.span(node.__name__) if trace is not None else Span(node.__name__, time.perf_counter())
+        token = current_span.set(span)
+        start = time.perf_counter()
+        try:
+          return await node(state)
+        finally:
+          span.seconds = time.perf_counter() - start
+          current_span.reset(token)
+          metrics.observe("zomato_node_duration_seconds", {"node": node.__name__}, span.seconds, help="Wall time of a LangGraph node.")
+
+    return traced_node
+
+def record_llm_usage(prompt_tokens, completion_tokens):
+    span, node = _span(), _node()
+    if span is not None:
+      span.llm_calls += 1
+      span.prompt_tokens += prompt_tokens
+      span.completion_tokens += completion_tokens
+
+    metrics.inc("zomato_llm_calls_total", {"node": node}, help="Gemini calls that completed.")
+    metrics.inc("zomato_llm_tokens_total", {"node": node, "type": "prompt"}, prompt_tokens, help="Gemini tokens used.")
+    metrics.inc("zomato_llm_tokens_total", {"node": node, "type": "completion"}, completion_tokens, help="Gemini tokens used.")
+
+def record_query(server_seconds, rows):
+    span, node = _span(), _node()
+    if span is not None:
+      span.neo4j_queries += 1
+      span.neo4j_server_seconds += server_seconds
+      span.neo4j_rows += rows
+
+    metrics.inc("zomato_neo4j_queries_total", {"node": node}, help="Neo4j statements run.")
+    metrics.inc("zomato_neo4j_server_seconds_total", {"node": node}, server_seconds, help="Neo4j time to first record plus time to consume, as reported by the server.")
+    metrics.inc("zomato_neo4j_rows_total", {"node": node}, rows, help="Records returned by Neo4j.")
+
+def record_cache(cache, hit):
+    span = _span()
+    if span is not None and hit:
+      span.cache_hits[cache] = span.cache_hits.get(cache, 0) + 1
+
+    metrics.inc("zomato_cache_lookups_total", {"cache": cache, "result": "hit" if hit else "miss"}, help="Cache lookups.")
+
+@functools.lru_cache(maxsize=None)
+def install_token_usage_handler():
+    """
+    Attributes the token usage of every chat model call to the current span,
+    from then on. Called when the graph is built rather than on import, since
+    importing langchain_core is slow.
+    """
+    from langchain_core.callbacks import BaseCallbackHandler
+    from langchain_core.messages import AIMessage
+    from langchain_core.tracers.context import register_configure_hook
+
+    class TokenUsageHandler(BaseCallbackHandler):
+        # Runs inline so it sees the caller's context variables
+        run_inline = True
+
+        def on_llm_end(self, response, **kwargs):
+            for generations in response.generations:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    if isinstance(message, AIMessage) and message.usage_metadata:
+                      record_llm_usage(message.usage_metadata.get("input_tokens", 0), message.usage_metadata.get("output_tokens", 0))
+                      return
+
+    token_usage_handler = contextvars.ContextVar("zomato_token_usage_handler", default=TokenUsageHandler())
+    register_configure_hook(token_usage_handler, inheritable=True)
+    return token_usage_handler